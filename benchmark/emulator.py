@@ -0,0 +1,156 @@
+import argparse
+import asyncio
+import json
+import random
+
+from aiohttp import web
+
+default_options = {
+    "latency": 0.02,
+    "jitter": 0.01,
+    "bandwidth": 50.0,
+    "failure_rate": 0.02,
+    "segments": 2,
+    "segment_size": 64 * 1024,
+    "stream_duration": 2.0,
+    "fofa_channels": 100,
+    "subscribe_lines": 1000,
+}
+
+chunk_size = 16 * 1024
+
+
+class UpstreamEmulator:
+    """
+    Local stand-in of the IPTV upstreams, serves the HLS playlists and segments, the udpxy streams,
+    the FOFA json and the subscribe files with the configured latency, bandwidth and failure rate
+    """
+
+    def __init__(self, options=None):
+        self.options = {**default_options, **(options or {})}
+        self.stats = {"requests": 0, "failures": 0, "bytes": 0}
+
+    async def delay(self):
+        await asyncio.sleep(self.options["latency"] + random.uniform(0, self.options["jitter"]))
+
+    def check_failure(self) -> bool:
+        self.stats["requests"] += 1
+        if random.random() < self.options["failure_rate"]:
+            self.stats["failures"] += 1
+            return True
+        return False
+
+    async def send_body(self, request, response, size):
+        """
+        Send the body of the size at the bandwidth of the connection
+        """
+        await response.prepare(request)
+        if request.method == "HEAD":
+            return response
+        chunk = b"G" + bytes(chunk_size - 1)
+        chunk_time = chunk_size / (self.options["bandwidth"] * 1024 * 1024)
+        sent = 0
+        while sent < size:
+            data = chunk[:min(chunk_size, size - sent)]
+            await response.write(data)
+            sent += len(data)
+            self.stats["bytes"] += len(data)
+            await asyncio.sleep(chunk_time)
+        await response.write_eof()
+        return response
+
+    async def handle_playlist(self, request):
+        await self.delay()
+        if self.check_failure():
+            return web.Response(status=503)
+        channel_id = request.match_info["id"]
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:4", "#EXT-X-MEDIA-SEQUENCE:1"]
+        for n in range(self.options["segments"]):
+            lines += ["#EXTINF:4.000,", f"/seg/{channel_id}/{n}.ts"]
+        return web.Response(text="\n".join(lines) + "\n", content_type="application/vnd.apple.mpegurl")
+
+    async def handle_segment(self, request):
+        await self.delay()
+        if self.check_failure():
+            return web.Response(status=503)
+        size = self.options["segment_size"]
+        response = web.StreamResponse(headers={"Content-Type": "video/mp2t", "Content-Length": str(size)})
+        return await self.send_body(request, response, size)
+
+    async def handle_rtp(self, request):
+        await self.delay()
+        if self.check_failure():
+            return web.Response(status=503)
+        size = int(self.options["bandwidth"] * 1024 * 1024 * self.options["stream_duration"])
+        response = web.StreamResponse(headers={"Content-Type": "video/mp2t"})
+        return await self.send_body(request, response, size)
+
+    async def handle_fofa_json(self, request):
+        await self.delay()
+        if self.check_failure():
+            return web.Response(status=503)
+        data = [
+            {"name": f"CCTV-{n % 17 + 1}", "url": f"/tsfile/live/{n:04d}_1.m3u8"}
+            for n in range(self.options["fofa_channels"])
+        ]
+        return web.Response(text=json.dumps({"code": 0, "data": data}), content_type="application/json")
+
+    async def handle_subscribe(self, request):
+        await self.delay()
+        if self.check_failure():
+            return web.Response(status=503)
+        file_id = int(request.match_info["id"])
+        host = request.host
+        lines = []
+        for n in range(self.options["subscribe_lines"]):
+            channel_id = file_id * self.options["subscribe_lines"] + n
+            lines.append(f"CCTV-{channel_id % 17 + 1},http://{host}/live/{channel_id}.m3u8")
+        return web.Response(text="\n".join(lines))
+
+    async def handle_stats(self, request):
+        return web.json_response(self.stats)
+
+    def get_app(self):
+        app = web.Application()
+        app.router.add_get("/live/{id}.m3u8", self.handle_playlist)
+        app.router.add_get("/seg/{id}/{n}.ts", self.handle_segment)
+        app.router.add_get("/rtp/{address}", self.handle_rtp)
+        app.router.add_get("/iptv/live/1000.json", self.handle_fofa_json)
+        app.router.add_get("/tsfile/live/{id}.m3u8", self.handle_playlist)
+        app.router.add_get("/sub/{id}.txt", self.handle_subscribe)
+        app.router.add_get("/stats", self.handle_stats)
+        return app
+
+
+async def serve(ports, options=None, host="127.0.0.1", ready=None):
+    """
+    Serve the emulator on the ports, every port stands for an upstream host
+    """
+    runner = web.AppRunner(UpstreamEmulator(options).get_app(), access_log=None)
+    await runner.setup()
+    for port in ports:
+        await web.TCPSite(runner, host, port, backlog=1024).start()
+    if ready:
+        ready.set()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def run_emulator(ports, options=None, host="127.0.0.1", ready=None):
+    try:
+        asyncio.run(serve(ports, options, host, ready))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in server of the IPTV upstreams")
+    parser.add_argument("--ports", default="8080", help="Ports to serve, separated by commas")
+    for key, value in default_options.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+    emulator_options = {key: getattr(args, key) for key in default_options}
+    print(f"Emulator serving on ports {args.ports}")
+    run_emulator([int(port) for port in args.ports.split(",")], emulator_options)
@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from queue import Empty
+from time import time
+
+from benchmark.emulator import default_options, run_emulator
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+benchmark_config = {
+    "open_sort": "True",
+    "open_filter_resolution": "False",
+    "open_filter_speed": "True",
+    "open_incremental": "False",
+    "open_history": "False",
+    "open_proxy": "False",
+    "open_driver": "False",
+    "open_update_time": "False",
+    "sort_time_budget": "0",
+    "sort_timeout": "5",
+    "request_timeout": "5",
+    "request_rate_limit": "*:0",
+    "min_speed": "0.2",
+}
+
+url_kinds = {"m3u8": 0.7, "ts": 0.1, "rtp": 0.2}
+
+
+def get_free_ports(num):
+    """
+    Get the free ports of the localhost
+    """
+    sockets = []
+    try:
+        for _ in range(num):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(("127.0.0.1", 0))
+            sockets.append(sock)
+        return [sock.getsockname()[1] for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+def get_channel_data(size, ports):
+    """
+    Get the synthetic channel data of the size, every url has its own cache key so all of them are tested
+    """
+    kinds = [kind for kind, ratio in url_kinds.items() for _ in range(int(ratio * 10))]
+    channels = {}
+    for i in range(size):
+        port = ports[i % len(ports)]
+        kind = kinds[i % len(kinds)]
+        if kind == "m3u8":
+            url = f"http://127.0.0.1:{port}/live/{i}.m3u8"
+        elif kind == "ts":
+            url = f"http://127.0.0.1:{port}/seg/{i}/0.ts"
+        else:
+            url = f"http://127.0.0.1:{port}/rtp/239.1.{i // 256 % 256}.{i % 256}:5000"
+        channels.setdefault(f"CCTV-{i // 10}", []).append({
+            "url": f"{url}$订阅源-cache:bench{i}",
+            "date": None,
+            "resolution": None,
+            "origin": "subscribe",
+            "ipv_type": "ipv4",
+        })
+    return {"Benchmark": channels}
+
+
+def prepare_workdir(workdir, settings=None):
+    """
+    Prepare the work directory with the default config and the benchmark settings
+    """
+    settings = benchmark_config if settings is None else settings
+    config_path = os.path.join(workdir, "config")
+    os.makedirs(config_path, exist_ok=True)
+    shutil.copyfile(os.path.join(root_path, "config", "config.ini"), os.path.join(config_path, "config.ini"))
+    shutil.copyfile(os.path.join(root_path, "version.json"), os.path.join(workdir, "version.json"))
+    with open(os.path.join(config_path, "user_config.ini"), "w", encoding="utf-8") as file:
+        file.write("[Settings]\n" + "".join(f"{key} = {value}\n" for key, value in settings.items()))
+
+
+async def run_stages(size, alive_ports, ports, stages):
+    """
+    Run the stages against the emulator, return the result of every stage
+    """
+    from updates.fofa.request import process_fofa_json_url
+    from updates.subscribe import get_channels_by_subscribe_urls
+    from utils.channel import process_sort_channel_list
+    from utils.trace import get_peak_rss
+
+    results = {}
+    if "subscribe" in stages:
+        files = max(size // default_options["subscribe_lines"], 1)
+        subscribe_urls = [f"http://127.0.0.1:{alive_ports[n % len(alive_ports)]}/sub/{n}.txt" for n in range(files)]
+        start_time = time()
+        channels = await get_channels_by_subscribe_urls(subscribe_urls, retry=False, error_print=False)
+        wall = time() - start_time
+        urls = sum(len(info_list) for info_list in channels.values())
+        results["subscribe"] = {"requests": files, "urls": urls, "wall": round(wall, 3),
+                                "throughput": round(urls / wall, 1) if wall else None}
+    if "fofa_json" in stages:
+        hosts = [f"http://127.0.0.1:{port}" for port in ports]
+        requests_num = max(size // default_options["fofa_channels"], 1)
+        start_time = time()
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            channels = list(executor.map(
+                lambda n: process_fofa_json_url(hosts[n % len(hosts)], "Benchmark", True), range(requests_num)
+            ))
+        wall = time() - start_time
+        urls = sum(len(info_list) for result in channels for info_list in result.values())
+        results["fofa_json"] = {"requests": requests_num, "urls": urls, "wall": round(wall, 3),
+                                "throughput": round(urls / wall, 1) if wall else None}
+    if "sort" in stages:
+        data = get_channel_data(size, ports)
+        start_time = time()
+        result = await process_sort_channel_list(data)
+        wall = time() - start_time
+        result_urls = sum(len(info_list) for channel_obj in result.values() for info_list in channel_obj.values())
+        results["sort"] = {"urls": size, "result_urls": result_urls, "wall": round(wall, 3),
+                           "throughput": round(size / wall, 1) if wall else None}
+    results["peak_rss_mb"] = get_peak_rss()
+    return results
+
+
+def run_size(size, alive_ports, ports, stages, queue):
+    """
+    Run the benchmark of the size in a fresh process and work directory, the peak memory is of this size only
+    """
+    workdir = tempfile.mkdtemp(prefix="iptv-benchmark-")
+    try:
+        prepare_workdir(workdir)
+        os.chdir(workdir)
+        sys.path.insert(0, root_path)
+        queue.put(asyncio.run(run_stages(size, alive_ports, ports, stages)))
+    except Exception as e:
+        queue.put({"error": repr(e)})
+    finally:
+        os.chdir(root_path)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def get_size_result(queue, process):
+    """
+    Get the result of the size process, an error if the process exits without putting the result (e.g. out of memory)
+    """
+    while True:
+        alive = process.is_alive()
+        try:
+            return queue.get(timeout=1)
+        except Empty:
+            if not alive:
+                return {"error": f"Benchmark process exited with code {process.exitcode} without the result"}
+
+
+def run_benchmark(sizes, hosts, dead_hosts, stages, options):
+    """
+    Start the emulator and run the benchmark of every size
+    """
+    context = multiprocessing.get_context("spawn")
+    ports = get_free_ports(hosts)
+    dead_num = int(hosts * dead_hosts)
+    alive_ports = ports[dead_num:] or ports
+    ready = context.Event()
+    emulator = context.Process(target=run_emulator, args=(alive_ports, options), kwargs={"ready": ready},
+                               daemon=True)
+    emulator.start()
+    if not ready.wait(30):
+        raise RuntimeError("Emulator start failed")
+    report = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "hosts": hosts,
+        "dead_hosts": dead_num,
+        "options": options,
+        "results": {},
+    }
+    try:
+        for size in sizes:
+            print(f"Benchmark {size} urls...")
+            queue = context.Queue()
+            process = context.Process(target=run_size, args=(size, alive_ports, ports, stages, queue))
+            process.start()
+            result = get_size_result(queue, process)
+            process.join()
+            report["results"][str(size)] = result
+            print(json.dumps(result, ensure_ascii=False))
+    finally:
+        emulator.terminate()
+        emulator.join()
+    return report
+
+
+def print_report(report):
+    print(f"\n{'size':>8} {'stage':<10} {'urls':>8} {'wall(s)':>9} {'urls/s':>10} {'peak rss(MB)':>13}")
+    for size, result in report["results"].items():
+        for stage, data in result.items():
+            if isinstance(data, dict):
+                print(f"{size:>8} {stage:<10} {data['urls']:>8} {data['wall']:>9} {data['throughput'] or '-':>10} "
+                      f"{result.get('peak_rss_mb') or '-':>13}")
+            elif stage == "error":
+                print(f"{size:>8} error: {data}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of the fetchers and the speed test")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Numbers of urls, separated by commas")
+    parser.add_argument("--stages", default="subscribe,fofa_json,sort",
+                        help="Stages to run, separated by commas: subscribe, fofa_json, sort")
+    parser.add_argument("--hosts", type=int, default=20, help="Number of the emulated upstream hosts")
+    parser.add_argument("--dead-hosts", type=float, default=0.1, help="Ratio of the hosts refusing connections")
+    parser.add_argument("--output", default=os.path.join(root_path, "output", "benchmark"),
+                        help="Directory of the result json")
+    for key, value in default_options.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+    emulator_options = {key: getattr(args, key) for key in default_options}
+    benchmark_report = run_benchmark(
+        [int(size) for size in args.sizes.split(",")],
+        args.hosts,
+        args.dead_hosts,
+        set(args.stages.split(",")),
+        emulator_options,
+    )
+    print_report(benchmark_report)
+    os.makedirs(args.output, exist_ok=True)
+    output_file = os.path.join(args.output, f"harness_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_file, "w", encoding="utf-8") as file:
+        json.dump(benchmark_report, file, ensure_ascii=False, indent=2)
+    print(f"Benchmark result written to {output_file}")
@@ -0,0 +1,295 @@
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from datetime import datetime
+from statistics import mean, median
+from time import perf_counter
+
+from benchmark.harness import prepare_workdir, root_path
+
+micro_config = {
+    "open_history": "False",
+    "open_local": "False",
+    "open_keep_all": "False",
+    "open_subscribe": "True",
+    "open_hotel": "True",
+    "open_hotel_fofa": "False",
+    "open_hotel_foodie": "True",
+    "open_multicast": "True",
+    "open_online_search": "False",
+    "open_empty_category": "True",
+    "open_update_time": "False",
+    "open_filter_speed": "True",
+    "open_filter_resolution": "False",
+    "open_supply": "True",
+    "ipv_type_prefer": "ipv4,ipv6",
+    "origin_type_prefer": "",
+}
+
+source_ratios = {"subscribe": 0.6, "hotel_foodie": 0.25, "multicast": 0.15}
+
+categories = 20
+
+subscribe_files = 10
+
+
+def get_host(rng, hosts):
+    n = rng.randrange(hosts)
+    if n % 5 == 0:
+        return f"[2409:8087:{n // 65536:x}:{n % 65536:x}::1]:8080"
+    return f"10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}:{8000 + n % 100}"
+
+
+def get_url(rng, source, host, n):
+    if source == "multicast":
+        return f"http://{host}/rtp/239.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}:5000"
+    if source == "hotel_foodie":
+        return f"http://{host}/tsfile/live/{n % 1000:04d}_1.m3u8"
+    return f"http://{host}/live/{n}/index.m3u8?token={rng.getrandbits(32):08x}"
+
+
+def get_source_data(channels, urls_per_channel, hosts, seed=0):
+    """
+    Get the synthetic source results of the channels, the urls of a channel share some hosts like the real sources
+    """
+    rng = random.Random(seed)
+    names = [f"bench{i}" for i in range(channels)]
+    sources = {source: {} for source in source_ratios}
+    n = 0
+    for name in names:
+        channel_hosts = [get_host(rng, hosts) for _ in range(max(urls_per_channel // 2, 1))]
+        for _ in range(urls_per_channel):
+            source = rng.choices(list(source_ratios), weights=list(source_ratios.values()))[0]
+            host = rng.choice(channel_hosts)
+            sources[source].setdefault(name, []).append({
+                "url": f"{get_url(rng, source, host, n)}$cache:{host}",
+                "date": None,
+                "resolution": rng.choice([None, "1920x1080", "1280x720"]),
+                "origin": source.partition("_")[0],
+                "ipv_type": "ipv6" if host.startswith("[") else "ipv4",
+            })
+            n += 1
+    return names, sources
+
+
+def get_channel_items(names):
+    """
+    Get the channel items of the template, split the names into the categories
+    """
+    items = {}
+    for i, name in enumerate(names):
+        items.setdefault(f"Category{i % categories}", {})[name] = []
+    return list(items.items())
+
+
+def get_sort_data(names, sources):
+    """
+    Get the data before the sort, every channel has the urls of all the sources
+    """
+    data = {}
+    for i, name in enumerate(names):
+        data.setdefault(f"Category{i % categories}", {})[name] = [
+            info for result in sources.values() for info in result.get(name, [])
+        ]
+    return data
+
+
+def get_subscribe_parts(subscribe_result, rng):
+    """
+    Split the subscribe result into the results of the subscribe files, part of the urls appear in several files
+    """
+    parts = [{} for _ in range(subscribe_files)]
+    for name, info_list in subscribe_result.items():
+        for info in info_list:
+            for part in rng.sample(parts, rng.choice([1, 1, 1, 2])):
+                part.setdefault(name, []).append(dict(info))
+    return parts
+
+
+def get_speed_cache(sort_data, seed=0):
+    """
+    Get the speed test cache of all the cache keys of the data
+    """
+    rng = random.Random(seed)
+    speed_cache = {}
+    for channel_obj in sort_data.values():
+        for info_list in channel_obj.values():
+            for info in info_list:
+                key = info["url"].partition("$cache:")[2]
+                if key not in speed_cache:
+                    failed = rng.random() < 0.3
+                    speed_cache[key] = [{
+                        "speed": 0 if failed else round(rng.uniform(0.1, 10), 2),
+                        "delay": -1 if failed else rng.randint(20, 2000),
+                        "resolution": info["resolution"],
+                    }]
+    return speed_cache
+
+
+def run_case(name, func, setup=None, rounds=3, size=None):
+    """
+    Run the case for the rounds, the setup runs before every round and is not timed
+    """
+    times = []
+    with open(os.devnull, "w", encoding="utf-8") as devnull, redirect_stdout(devnull):
+        for _ in range(rounds):
+            args = setup() if setup else ()
+            start_time = perf_counter()
+            func(*args)
+            times.append(perf_counter() - start_time)
+    result = {
+        "rounds": rounds,
+        "min": round(min(times), 4),
+        "max": round(max(times), 4),
+        "mean": round(mean(times), 4),
+        "median": round(median(times), 4),
+    }
+    if size:
+        result["size"] = size
+        result["ops"] = round(size / min(times), 1) if min(times) else None
+    print(f"{name:<28} {result['min']:>10} {result['median']:>10} {result['max']:>10} {result.get('ops') or '-':>12}")
+    return result
+
+
+def run_cases(channels, urls_per_channel, hosts, rounds, cases):
+    """
+    Run the cases on the synthetic data, return the result of every case
+    """
+    import utils.constants as constants
+    from utils.channel import append_data_to_info_data, append_total_data, write_channel_to_file
+    from utils.config import config
+    from utils.speed import cache as speed_cache, sort_urls
+    from utils.tools import convert_to_m3u, get_total_urls, merge_objects, process_nested_dict, resource_path
+
+    names, sources = get_source_data(channels, urls_per_channel, hosts)
+    items = get_channel_items(names)
+    sort_data = get_sort_data(names, sources)
+    total_data = {}
+    urls = sum(len(info_list) for channel_obj in sort_data.values() for info_list in channel_obj.values())
+    rng = random.Random(1)
+
+    def append_total():
+        data = {}
+        append_total_data(items, names, data, hotel_foodie_result=sources["hotel_foodie"],
+                          multicast_result=sources["multicast"], subscribe_result=sources["subscribe"])
+        total_data.clear()
+        total_data.update(data)
+
+    def append_info():
+        data = {}
+        for cate, channel_obj in sort_data.items():
+            for name, info_list in channel_obj.items():
+                append_data_to_info_data(data, cate, name, info_list)
+
+    def sort_all():
+        for channel_obj in sort_data.values():
+            for name, info_list in channel_obj.items():
+                sort_urls(name, info_list)
+
+    def total_urls():
+        ipv_type_prefer = list(config.ipv_type_prefer)
+        for channel_obj in total_data.values():
+            for info_list in channel_obj.values():
+                get_total_urls(info_list, ipv_type_prefer, config.origin_type_prefer)
+
+    def merge_parts(parts):
+        result = {}
+        for part in parts:
+            result = merge_objects(result, part)
+
+    def write_result():
+        write_channel_to_file(total_data)
+        shutil.copyfile(resource_path(constants.result_path), resource_path(config.final_file, persistent=True))
+
+    def get_total_data():
+        if not total_data:
+            with open(os.devnull, "w", encoding="utf-8") as devnull, redirect_stdout(devnull):
+                append_total()
+        return ()
+
+    def get_final_file():
+        if not os.path.exists(resource_path(config.final_file)):
+            get_total_data()
+            with open(os.devnull, "w", encoding="utf-8") as devnull, redirect_stdout(devnull):
+                write_result()
+        return ()
+
+    subscribe_urls = sum(len(info_list) for info_list in sources["subscribe"].values())
+    all_cases = {
+        "append_total_data": (append_total, None, urls),
+        "append_data_to_info_data": (append_info, None, urls),
+        "process_nested_dict": (
+            lambda data: process_nested_dict(data, seen={}, flag=r"cache:(.*)", force_str="!"),
+            lambda: (copy.deepcopy(sort_data),),
+            urls
+        ),
+        "sort_urls": (sort_all, lambda: speed_cache.update(get_speed_cache(sort_data)) or (), urls),
+        "merge_objects": (merge_parts, lambda: (get_subscribe_parts(sources["subscribe"], rng),), subscribe_urls),
+        "get_total_urls": (total_urls, get_total_data, None),
+        "write_channel_to_file": (write_result, get_total_data, len(names)),
+        "convert_to_m3u": (convert_to_m3u, get_final_file, len(names)),
+    }
+    print(f"{'case':<28} {'min(s)':>10} {'median(s)':>10} {'max(s)':>10} {'ops/s':>12}")
+    results = {}
+    for name in cases:
+        func, setup, size = all_cases[name]
+        if name == "get_total_urls":
+            get_total_data()
+            size = sum(len(info_list) for channel_obj in total_data.values() for info_list in channel_obj.values())
+        results[name] = run_case(name, func, setup=setup, rounds=rounds, size=size)
+    return {"channels": channels, "urls": urls, "hosts": hosts, "cases": results}
+
+
+def run_micro(channels, urls_per_channel, hosts, rounds, cases):
+    """
+    Run the micro benchmarks in a temp work directory with the benchmark settings
+    """
+    workdir = tempfile.mkdtemp(prefix="iptv-micro-")
+    try:
+        prepare_workdir(workdir, micro_config)
+        for name in ["blacklist.txt", "whitelist.txt"]:
+            shutil.copyfile(os.path.join(root_path, "config", name), os.path.join(workdir, "config", name))
+        os.chdir(workdir)
+        sys.path.insert(0, root_path)
+        from utils.tools import get_version_info
+
+        report = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "version": get_version_info().get("version"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        }
+        report.update(run_cases(channels, urls_per_channel, hosts, rounds, cases))
+        return report
+    finally:
+        os.chdir(root_path)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    case_names = ["append_total_data", "append_data_to_info_data", "process_nested_dict", "sort_urls",
+                  "merge_objects", "get_total_urls", "write_channel_to_file", "convert_to_m3u"]
+    parser = argparse.ArgumentParser(description="Micro benchmarks of the merge, dedup and write paths")
+    parser.add_argument("--channels", type=int, default=20000, help="Number of the channels")
+    parser.add_argument("--urls-per-channel", type=int, default=10, help="Number of the urls of every channel")
+    parser.add_argument("--hosts", type=int, default=50000, help="Number of the distinct hosts")
+    parser.add_argument("--rounds", type=int, default=3, help="Rounds of every case")
+    parser.add_argument("--cases", default=",".join(case_names),
+                        help=f"Cases to run, separated by commas: {', '.join(case_names)}")
+    parser.add_argument("--output", default=os.path.join(root_path, "output", "benchmark"),
+                        help="Directory of the result json")
+    args = parser.parse_args()
+    micro_report = run_micro(args.channels, args.urls_per_channel, args.hosts, args.rounds,
+                             args.cases.split(","))
+    os.makedirs(args.output, exist_ok=True)
+    output_file = os.path.join(args.output, f"micro_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_file, "w", encoding="utf-8") as file:
+        json.dump(micro_report, file, ensure_ascii=False, indent=2)
+    print(f"Benchmark result written to {output_file}")
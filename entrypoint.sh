@@ -28,6 +28,6 @@ fi
 
 /usr/sbin/crond -b -L /tmp/dcron.log -l 4 &
 
-python $APP_WORKDIR/main.py &
+python $APP_WORKDIR/main.py --resume &
 
-python -m gunicorn service.app:app -b 0.0.0.0:$APP_PORT --timeout=1000
+python -m gunicorn service.app:app -b 0.0.0.0:$APP_PORT --timeout=1000 --worker-class=gthread --threads=${APP_THREADS:-100}
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import copy
 import pickle
@@ -11,7 +12,9 @@ from updates.fofa import get_channels_by_fofa
 from updates.hotel import get_channels_by_hotel
 from updates.multicast import get_channels_by_multicast
 from updates.online_search import get_channels_by_online_search
+from updates.proxy import proxy_pool
 from updates.subscribe import get_channels_by_subscribe_urls
+from utils.cache import update_host_state, get_data_cache_keys
 from utils.channel import (
     get_channel_items,
     append_total_data,
@@ -19,8 +22,21 @@ from utils.channel import (
     write_channel_to_file,
     get_channel_data_cache_with_compare,
     format_channel_url_info,
+    get_unique_channel_names,
 )
 from utils.config import config
+from utils.driver.pool import driver_pool
+from utils.metrics import (
+    metrics,
+    source_fetch_seconds,
+    source_result_urls,
+    update_duration_seconds,
+    update_last_success_timestamp,
+    monitor_event_loop_lag,
+)
+from utils.requests.client import http_client
+from utils.retry import retry_policy
+from utils.speed import cache as speed_cache
 from utils.tools import (
     update_file,
     get_pbar_remaining,
@@ -33,12 +49,15 @@ from utils.tools import (
     get_urls_from_file,
     get_version_info
 )
+from utils.trace import tracer
 from utils.types import CategoryChannelData
 
 
 class UpdateSource:
 
-    def __init__(self):
+    def __init__(self, resume=False, profile=None):
+        self.resume = resume
+        self.profile = profile
         self.update_progress = None
         self.run_ui = False
         self.tasks = []
@@ -65,6 +84,12 @@ class UpdateSource:
                 "online_search_result",
             ),
         ]
+        query_names = get_unique_channel_names(channel_names or [])
+        if len(query_names) < len(channel_names or []):
+            print(
+                f"Channel names: {len(channel_names)}, unique: {len(query_names)}, "
+                f"{len(channel_names) - len(query_names)} queries saved per search source"
+            )
 
         for setting, task_func, result_attr in tasks_config:
             if (
@@ -72,20 +97,29 @@ class UpdateSource:
             ) and config.open_hotel == False:
                 continue
             if config.open_method[setting]:
-                if setting == "subscribe":
-                    subscribe_urls = get_urls_from_file(constants.subscribe_path)
-                    whitelist_urls = get_urls_from_file(constants.whitelist_path)
-                    task = asyncio.create_task(
-                        task_func(subscribe_urls, whitelist=whitelist_urls, callback=self.update_progress)
-                    )
-                elif setting == "hotel_foodie" or setting == "hotel_fofa":
-                    task = asyncio.create_task(task_func(callback=self.update_progress))
-                else:
-                    task = asyncio.create_task(
-                        task_func(channel_names, callback=self.update_progress)
-                    )
-                self.tasks.append(task)
-                setattr(self, result_attr, await task)
+                with tracer.span(setting):
+                    if setting == "subscribe":
+                        subscribe_urls = get_urls_from_file(constants.subscribe_path)
+                        whitelist_urls = get_urls_from_file(constants.whitelist_path)
+                        task = asyncio.create_task(
+                            task_func(subscribe_urls, whitelist=whitelist_urls, callback=self.update_progress)
+                        )
+                    elif setting == "hotel_foodie" or setting == "hotel_fofa":
+                        task = asyncio.create_task(task_func(callback=self.update_progress))
+                    else:
+                        task = asyncio.create_task(
+                            task_func(query_names, callback=self.update_progress)
+                        )
+                    self.tasks.append(task)
+                    start_time = time()
+                    result = await task
+                setattr(self, result_attr, result)
+                source_fetch_seconds.observe(time() - start_time, source=setting)
+                source_result_urls.set(
+                    sum(len(info_list) for info_list in result.values() if isinstance(info_list, list))
+                    if isinstance(result, dict) else 0,
+                    source=setting,
+                )
 
     def pbar_update(self, name: str = ""):
         if self.pbar.n < self.total:
@@ -108,11 +142,15 @@ class UpdateSource:
         return len(processed_urls)
 
     async def main(self):
+        lag_task = None
         try:
             user_final_file = config.final_file
             main_start_time = time()
             if config.open_update:
-                self.channel_items = get_channel_items()
+                tracer.reset(profile_stage=self.profile)
+                retry_policy.reset()
+                with tracer.span("get_channel_items"):
+                    self.channel_items = get_channel_items()
                 channel_names = [
                     name
                     for channel_obj in self.channel_items.values()
@@ -121,18 +159,27 @@ class UpdateSource:
                 if not channel_names:
                     print(f"❌ No channel names found! Please check the {config.source_file}!")
                     return
-                await self.visit_page(channel_names)
+                lag_task = asyncio.create_task(monitor_event_loop_lag())
+                with tracer.span("visit_page"):
+                    await self.visit_page(channel_names)
+                update_duration_seconds.set(time() - main_start_time, stage="fetch")
                 self.tasks = []
-                append_total_data(
-                    self.channel_items.items(),
-                    channel_names,
-                    self.channel_data,
-                    self.hotel_fofa_result,
-                    self.multicast_result,
-                    self.hotel_foodie_result,
-                    self.subscribe_result,
-                    self.online_search_result,
-                )
+                http_client.close()
+                if config.open_driver:
+                    driver_pool.close()
+                if config.open_proxy:
+                    proxy_pool.stop_check()
+                with tracer.span("append_total_data"):
+                    append_total_data(
+                        self.channel_items.items(),
+                        channel_names,
+                        self.channel_data,
+                        self.hotel_fofa_result,
+                        self.multicast_result,
+                        self.hotel_foodie_result,
+                        self.subscribe_result,
+                        self.online_search_result,
+                    )
                 channel_data_cache = copy.deepcopy(self.channel_data)
                 ipv6_support = config.ipv6_support or check_ipv6_support()
                 open_sort = config.open_sort
@@ -147,22 +194,27 @@ class UpdateSource:
                     )
                     self.start_time = time()
                     self.pbar = tqdm(total=self.total, desc="Sorting")
-                    self.channel_data = await process_sort_channel_list(
-                        self.channel_data,
-                        ipv6=ipv6_support,
-                        callback=sort_callback,
-                    )
+                    with tracer.span("process_sort_channel_list", urls=self.total):
+                        self.channel_data = await process_sort_channel_list(
+                            self.channel_data,
+                            ipv6=ipv6_support,
+                            callback=sort_callback,
+                            resume=self.resume,
+                        )
+                    update_duration_seconds.set(time() - self.start_time, stage="sort")
                 else:
                     format_channel_url_info(self.channel_data)
                 self.total = self.get_urls_len()
                 self.pbar = tqdm(total=self.total, desc="Writing")
                 self.start_time = time()
-                write_channel_to_file(
-                    self.channel_data,
-                    ipv6=ipv6_support,
-                    callback=lambda: self.pbar_update(name="写入结果"),
-                )
+                with tracer.span("write_channel_to_file", urls=self.total):
+                    write_channel_to_file(
+                        self.channel_data,
+                        ipv6=ipv6_support,
+                        callback=lambda: self.pbar_update(name="写入结果"),
+                    )
                 self.pbar.close()
+                update_host_state(get_data_cache_keys(channel_data_cache), speed_cache if open_sort else None)
                 update_file(user_final_file, constants.result_path)
                 if config.open_history:
                     if open_sort:
@@ -174,7 +226,13 @@ class UpdateSource:
                             "wb",
                     ) as file:
                         pickle.dump(channel_data_cache, file)
-                convert_to_m3u(channel_names[0])
+                with tracer.span("convert_to_m3u"):
+                    convert_to_m3u(channel_names[0])
+                lag_task.cancel()
+                tracer.write()
+                update_duration_seconds.set(time() - main_start_time, stage="total")
+                update_last_success_timestamp.set(time())
+                metrics.write()
                 print(
                     f"🥳 Update completed! Total time spent: {format_interval(time() - main_start_time)}. Please check the {user_final_file} file!"
                 )
@@ -196,6 +254,9 @@ class UpdateSource:
                     run_service()
         except asyncio.exceptions.CancelledError:
             print("Update cancelled!")
+        finally:
+            if lag_task:
+                lag_task.cancel()
 
     async def start(self, callback=None):
         def default_callback(self, *args, **kwargs):
@@ -214,9 +275,16 @@ class UpdateSource:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true",
+                        help="Resume the speed test from the checkpoint of the interrupted run")
+    parser.add_argument("--profile", metavar="STAGE",
+                        help="Run cProfile on the stage, e.g. visit_page, subscribe, process_sort_channel_list, "
+                             "write_channel_to_file, the stats are written to the output directory")
+    args = parser.parse_args()
     info = get_version_info()
     print(f"ℹ️ {info['name']} Version: {info['version']}")
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    update_source = UpdateSource()
+    update_source = UpdateSource(resume=args.resume, profile=args.profile)
     loop.run_until_complete(update_source.start())
@@ -1,15 +1,46 @@
 import os
 import sys
+from time import time
 
 sys.path.append(os.path.dirname(sys.path[0]))
-from flask import Flask, send_from_directory, make_response
-from utils.tools import get_result_file_content, get_ip_address, resource_path
+from flask import Flask, send_from_directory, make_response, request, jsonify, redirect, Response, url_for, g
+from service.result import (
+    get_result_file_content,
+    result_data_index,
+    get_channel_by_name,
+    get_channel_data,
+    get_channel_page,
+)
+from service.play import playback_selector
+from service.relay import stream_relay, get_relay_urls
+from service.hls import hls_proxy, get_hls_urls
+from service.revalidate import result_revalidator
+from utils.metrics import http_requests_total, http_request_seconds, get_metrics_text
+from utils.tools import get_ip_address, resource_path
 from utils.config import config
 import utils.constants as constants
 
 app = Flask(__name__)
 
 
+@app.before_request
+def start_revalidator():
+    result_revalidator.start()
+
+
+@app.before_request
+def start_request_timer():
+    g.start_time = time()
+
+
+@app.after_request
+def observe_request(response):
+    endpoint = request.endpoint or "unknown"
+    http_requests_total.inc(endpoint=endpoint, status=response.status_code)
+    http_request_seconds.observe(time() - g.start_time, endpoint=endpoint)
+    return response
+
+
 @app.route("/")
 def show_index():
     return get_result_file_content()
@@ -49,6 +80,155 @@ def show_log():
     return response
 
 
+def get_channel_filters():
+    """
+    Get the channel url filters of the request
+    """
+    return {
+        "ipv_type": request.args.get("ipv_type"),
+        "origin": request.args.get("origin"),
+        "min_resolution": request.args.get("min_resolution"),
+    }
+
+
+def make_waiting_response():
+    return jsonify({"error": constants.waiting_tip}), 503
+
+
+@app.route("/api/categories")
+def show_api_categories():
+    index = result_data_index.get()
+    if index is None:
+        return make_waiting_response()
+    return jsonify({"update_time": index["update_time"], "categories": index["categories"]})
+
+
+@app.route("/api/channels")
+def show_api_channels():
+    index = result_data_index.get()
+    if index is None:
+        return make_waiting_response()
+    return jsonify(get_channel_page(
+        index,
+        category=request.args.get("category"),
+        page=request.args.get("page", 1, type=int),
+        page_size=request.args.get("page_size", constants.api_page_size, type=int),
+        **get_channel_filters(),
+    ))
+
+
+@app.route("/api/channels/<path:name>")
+def show_api_channel(name):
+    index = result_data_index.get()
+    if index is None:
+        return make_waiting_response()
+    channel = get_channel_by_name(index, name)
+    if channel is None:
+        return jsonify({"error": f"Channel {name} not found"}), 404
+    return jsonify(get_channel_data(channel, **get_channel_filters()))
+
+
+@app.route("/play/<path:name>")
+def play_channel(name):
+    index = result_data_index.get()
+    if index is None:
+        return make_waiting_response()
+    channel = get_channel_by_name(index, name)
+    if channel is None:
+        return jsonify({"error": f"Channel {name} not found"}), 404
+    urls = [url_data["url"] for url_data in get_channel_data(channel, **get_channel_filters())["urls"]]
+    url = playback_selector.select((request.remote_addr, channel["name"]), urls)
+    if url is None:
+        return jsonify({"error": f"Channel {name} has no available url"}), 404
+    response = redirect(url, code=302)
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@app.route("/relay/<path:name>")
+def relay_channel(name):
+    index = result_data_index.get()
+    if index is None:
+        return make_waiting_response()
+    channel = get_channel_by_name(index, name)
+    if channel is None:
+        return jsonify({"error": f"Channel {name} not found"}), 404
+    urls = get_relay_urls([url_data["url"] for url_data in get_channel_data(channel, **get_channel_filters())["urls"]])
+    if not urls:
+        return redirect(url_for("play_channel", name=name, **request.args), code=302)
+    relay = stream_relay.get_channel(channel["name"], urls)
+    return Response(relay.stream(request.remote_addr), mimetype="video/mp2t",
+                    headers={"Cache-Control": "no-store"})
+
+
+@app.route("/api/relay/stats")
+def show_relay_stats():
+    return jsonify(stream_relay.get_stats())
+
+
+def make_playlist_response(content):
+    response = make_response(content)
+    response.mimetype = "application/vnd.apple.mpegurl"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/hls/playlist/<key>")
+def hls_playlist(key):
+    url = hls_proxy.get_uri(key)
+    content = hls_proxy.get_playlist(url) if url else None
+    if content is None:
+        return jsonify({"error": "Playlist not available"}), 404
+    return make_playlist_response(content)
+
+
+@app.route("/hls/segment/<key>")
+def hls_segment(key):
+    data = hls_proxy.get_segment(key)
+    if data is None:
+        return jsonify({"error": "Segment not available"}), 404
+    response = make_response(data)
+    response.mimetype = "video/mp2t"
+    response.headers["Cache-Control"] = f"max-age={constants.hls_segment_max_age}"
+    return response
+
+
+@app.route("/hls/<path:name>")
+def hls_channel(name):
+    index = result_data_index.get()
+    if index is None:
+        return make_waiting_response()
+    channel = get_channel_by_name(index, name)
+    if channel is None:
+        return jsonify({"error": f"Channel {name} not found"}), 404
+    urls = get_hls_urls([url_data["url"] for url_data in get_channel_data(channel, **get_channel_filters())["urls"]])
+    if not urls:
+        return redirect(url_for("play_channel", name=name, **request.args), code=302)
+    for url in urls:
+        content = hls_proxy.get_playlist(url)
+        if content is not None:
+            return make_playlist_response(content)
+    return jsonify({"error": f"Channel {name} has no available playlist"}), 502
+
+
+@app.route("/api/hls/stats")
+def show_hls_stats():
+    return jsonify(hls_proxy.get_stats())
+
+
+@app.route("/api/revalidate/stats")
+def show_revalidate_stats():
+    return jsonify({"interval": result_revalidator.interval, **result_revalidator.stats})
+
+
+@app.route("/metrics")
+def show_metrics():
+    response = make_response(get_metrics_text())
+    response.mimetype = "text/plain"
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return response
+
+
 def run_service():
     try:
         if not os.environ.get("GITHUB_ACTIONS"):
@@ -57,6 +237,11 @@ def run_service():
             print(f"📄 Log content: {ip_address}/log")
             print(f"🚀 M3u api: {ip_address}/m3u")
             print(f"🚀 Txt api: {ip_address}/txt")
+            print(f"🚀 Channel api: {ip_address}/api/channels")
+            print(f"🚀 Channel play: {ip_address}/play/<channel>")
+            print(f"🚀 Channel relay: {ip_address}/relay/<channel>")
+            print(f"🚀 Channel HLS proxy: {ip_address}/hls/<channel>")
+            print(f"📈 Metrics: {ip_address}/metrics")
             print(f"✅ You can use this url to watch IPTV 📺: {ip_address}")
             app.run(host="0.0.0.0", port=config.app_port)
     except Exception as e:
@@ -0,0 +1,280 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from time import time
+from urllib.parse import urlparse
+
+import m3u8
+
+import utils.constants as constants
+from utils.metrics import cache_requests_total
+from utils.requests.client import http_client
+from utils.requests.tools import headers
+from utils.tools import resource_path
+
+
+class SegmentCache:
+    """
+    Segment cache keyed by the segment url, a memory LRU in front of a disk LRU, both evicted by age and size
+    """
+
+    def __init__(self, path=constants.hls_cache_path, memory_size=constants.hls_memory_cache_size,
+                 disk_size=constants.hls_disk_cache_size, max_age=constants.hls_segment_max_age):
+        self.path = path
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.max_age = max_age
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.disk = None
+        self.disk_bytes = 0
+        self.fetching = {}
+        self.hits = {"memory": 0, "disk": 0, "upstream": 0}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_key(url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def get_disk_path(self, key):
+        return os.path.join(resource_path(self.path, persistent=True), key)
+
+    def load_disk(self):
+        """
+        Load the index of the disk cache from the cache directory, oldest first
+        """
+        self.disk = OrderedDict()
+        self.disk_bytes = 0
+        directory = resource_path(self.path, persistent=True)
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for mtime, key, size in sorted(entries):
+            self.disk[key] = (size, mtime)
+            self.disk_bytes += size
+
+    def evict(self):
+        """
+        Evict the expired entries and the least recently used entries over the size limits
+        """
+        expire_time = time() - self.max_age
+        while self.memory and (
+                self.memory_bytes > self.memory_size or next(iter(self.memory.values()))[1] < expire_time):
+            _, (data, _) = self.memory.popitem(last=False)
+            self.memory_bytes -= len(data)
+        removed = []
+        while self.disk and (self.disk_bytes > self.disk_size or next(iter(self.disk.values()))[1] < expire_time):
+            key, (size, _) = self.disk.popitem(last=False)
+            self.disk_bytes -= size
+            removed.append(key)
+        return removed
+
+    def get_cached(self, key):
+        """
+        Get the cached data of the key from the memory or the disk
+        """
+        with self.lock:
+            if self.disk is None:
+                self.load_disk()
+            removed = self.evict()
+            entry = self.memory.get(key)
+            if entry:
+                self.memory.move_to_end(key)
+                self.hits["memory"] += 1
+                data = entry[0]
+            else:
+                data = None
+                on_disk = key in self.disk
+                if on_disk:
+                    self.disk.move_to_end(key)
+        self.remove_disk(removed)
+        if data is not None or not on_disk:
+            return data
+        try:
+            with open(self.get_disk_path(key), "rb") as file:
+                data = file.read()
+        except:
+            return None
+        with self.lock:
+            self.hits["disk"] += 1
+            self.put_memory(key, data, time())
+        return data
+
+    def put_memory(self, key, data, created):
+        if key in self.memory:
+            self.memory_bytes -= len(self.memory.pop(key)[0])
+        self.memory[key] = (data, created)
+        self.memory_bytes += len(data)
+
+    def put(self, key, data):
+        """
+        Put the data into the memory and the disk cache
+        """
+        now = time()
+        path = self.get_disk_path(key)
+        try:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+            saved = True
+        except Exception as e:
+            print(f"Save HLS segment cache failed: {e}")
+            saved = False
+        with self.lock:
+            self.put_memory(key, data, now)
+            if saved:
+                if key in self.disk:
+                    self.disk_bytes -= self.disk.pop(key)[0]
+                self.disk[key] = (len(data), now)
+                self.disk_bytes += len(data)
+            removed = self.evict()
+        self.remove_disk(removed)
+
+    def remove_disk(self, keys):
+        for key in keys:
+            try:
+                os.remove(self.get_disk_path(key))
+            except:
+                pass
+
+    def get(self, url):
+        """
+        Get the segment of the url, only one request goes to the upstream for the concurrent viewers
+        """
+        key = self.get_key(url)
+        data = self.get_cached(key)
+        if data is not None:
+            cache_requests_total.inc(cache="hls_segment", result="hit")
+            return data
+        cache_requests_total.inc(cache="hls_segment", result="miss")
+        with self.lock:
+            event = self.fetching.get(key)
+            leader = event is None
+            if leader:
+                event = self.fetching[key] = threading.Event()
+        if not leader:
+            event.wait(constants.hls_request_timeout)
+            return self.get_cached(key)
+        try:
+            with http_client.get(url, headers=headers, timeout=constants.hls_request_timeout) as response:
+                response.raise_for_status()
+                data = response.content
+            with self.lock:
+                self.hits["upstream"] += 1
+            self.put(key, data)
+            return data
+        except Exception as e:
+            print(f"HLS segment {url} failed: {e}")
+            return None
+        finally:
+            with self.lock:
+                self.fetching.pop(key, None)
+            event.set()
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "memory_entries": len(self.memory),
+                "memory_bytes": self.memory_bytes,
+                "disk_entries": len(self.disk or {}),
+                "disk_bytes": self.disk_bytes,
+                "hits": dict(self.hits),
+            }
+
+
+class HlsProxy:
+    """
+    HLS proxy rewriting the playlist uris to go through the service, the segments are served from the segment cache
+    """
+
+    def __init__(self):
+        self.uris = OrderedDict()
+        self.playlists = {}
+        self.segment_cache = SegmentCache()
+        self.lock = threading.Lock()
+
+    def register_uri(self, url, kind):
+        """
+        Register the upstream url and get the proxy path of it
+        """
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()[:20]
+        with self.lock:
+            self.uris[key] = url
+            self.uris.move_to_end(key)
+            while len(self.uris) > constants.hls_max_uris:
+                self.uris.popitem(last=False)
+        if kind == "playlist":
+            return f"/hls/playlist/{key}.m3u8"
+        extension = os.path.splitext(urlparse(url).path)[1] or ".ts"
+        return f"/hls/segment/{key}{extension}"
+
+    def get_uri(self, key):
+        with self.lock:
+            return self.uris.get(os.path.splitext(key)[0])
+
+    def rewrite_playlist(self, content, url):
+        """
+        Rewrite the uris of the playlist to the proxy paths
+        """
+        playlist = m3u8.loads(content, uri=url)
+        for item in [*playlist.playlists, *playlist.iframe_playlists, *playlist.media]:
+            if item.uri:
+                item.uri = self.register_uri(item.absolute_uri, "playlist")
+        for key in [*playlist.keys, *playlist.session_keys]:
+            if key and key.uri:
+                key.uri = self.register_uri(key.absolute_uri, "segment")
+        for segment in playlist.segments:
+            if segment.init_section and segment.init_section.uri:
+                segment.init_section.uri = self.register_uri(segment.init_section.absolute_uri, "segment")
+            segment.uri = self.register_uri(segment.absolute_uri, "segment")
+        return playlist.dumps(), playlist.target_duration
+
+    def get_playlist(self, url):
+        """
+        Get the rewritten playlist of the url, shared by the viewers for half of the target duration
+        """
+        now = time()
+        with self.lock:
+            cached = self.playlists.get(url)
+        if cached and cached[1] > now:
+            return cached[0]
+        try:
+            with http_client.get(url, headers=headers, timeout=constants.hls_request_timeout) as response:
+                response.raise_for_status()
+                content, target_duration = self.rewrite_playlist(response.text, response.url)
+        except Exception as e:
+            print(f"HLS playlist {url} failed: {e}")
+            return None
+        ttl = max(min((target_duration or 0) / 2, constants.hls_playlist_max_ttl), 1)
+        with self.lock:
+            self.playlists = {key: value for key, value in self.playlists.items() if value[1] > now}
+            self.playlists[url] = (content, now + ttl)
+        return content
+
+    def get_segment(self, key):
+        url = self.get_uri(key)
+        return self.segment_cache.get(url) if url else None
+
+    def get_stats(self):
+        with self.lock:
+            uris = len(self.uris)
+            playlists = len(self.playlists)
+        return {"uris": uris, "playlists": playlists, "segments": self.segment_cache.get_stats()}
+
+
+hls_proxy = HlsProxy()
+
+
+def get_hls_urls(urls):
+    """
+    Get the HLS playlist urls of the channel
+    """
+    return [
+        url for url in urls
+        if url.startswith(("http://", "https://")) and ".m3u8" in url.lower()
+    ]
@@ -0,0 +1,103 @@
+import threading
+from time import time
+
+import utils.constants as constants
+from utils.metrics import cache_requests_total
+from utils.requests.client import http_client
+from utils.requests.tools import headers
+
+
+class PlaybackSelector:
+    """
+    Select the playback url of the channel by the test order, skip the urls failing the health check
+    and rotate to the next candidate when the same client retries quickly
+    """
+
+    def __init__(self):
+        self.health = {}
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def check_url(url) -> bool:
+        """
+        Check if the url responds within the health check timeout
+        """
+        if not url.startswith(("http://", "https://")):
+            return True
+        try:
+            with http_client.get(url, headers=headers, timeout=constants.play_health_timeout,
+                                 stream=True) as response:
+                return response.status_code < 400
+        except:
+            return False
+
+    def get_health(self, url):
+        """
+        Get the cached health of the url, None if unknown or expired
+        """
+        result = self.health.get(url)
+        if result and time() - result[1] < constants.play_health_ttl:
+            return result[0]
+        return None
+
+    def check_health(self, url) -> bool:
+        """
+        Check the health of the url with the cache
+        """
+        healthy = self.get_health(url)
+        cache_requests_total.inc(cache="play_health", result="miss" if healthy is None else "hit")
+        if healthy is None:
+            healthy = self.check_url(url)
+            now = time()
+            with self.lock:
+                if len(self.health) > constants.play_max_health:
+                    self.health = {
+                        key: value for key, value in self.health.items()
+                        if now - value[1] < constants.play_health_ttl
+                    }
+                self.health[url] = (healthy, now)
+        return healthy
+
+    def get_start(self, client_key, urls) -> int:
+        """
+        Get the index of the first candidate, move after the last served url if the client retries quickly
+        """
+        now = time()
+        with self.lock:
+            last = self.clients.get(client_key)
+            if len(self.clients) > constants.play_max_clients:
+                self.clients = {
+                    key: value for key, value in self.clients.items()
+                    if now - value[1] < constants.play_retry_window
+                }
+        if last and now - last[1] < constants.play_retry_window and last[0] in urls:
+            return (urls.index(last[0]) + 1) % len(urls)
+        return 0
+
+    def select(self, client_key, urls):
+        """
+        Select the playback url from the urls in the order of the test result
+        """
+        if not urls:
+            return None
+        start = self.get_start(client_key, urls)
+        candidates = urls[start:] + urls[:start]
+        selected = None
+        checks = 0
+        for url in candidates:
+            healthy = self.get_health(url)
+            if healthy is None and checks < constants.play_max_checks:
+                checks += 1
+                healthy = self.check_health(url)
+            if healthy:
+                selected = url
+                break
+        if selected is None:
+            selected = next((url for url in candidates if self.get_health(url) is not False), candidates[0])
+        with self.lock:
+            self.clients[client_key] = (selected, time())
+        return selected
+
+
+playback_selector = PlaybackSelector()
@@ -0,0 +1,198 @@
+import threading
+from collections import deque
+from itertools import count
+from time import time
+
+import utils.constants as constants
+from utils.requests.client import http_client
+from utils.requests.tools import headers
+
+
+class RelayChannel:
+    """
+    Relay of the channel, one upstream reader fills the ring buffer and the clients read from it at their own pace
+    """
+
+    def __init__(self, name, urls, on_close=None):
+        self.name = name
+        self.urls = urls
+        self.on_close = on_close
+        self.url = None
+        self.buffer = deque(maxlen=constants.relay_buffer_chunks)
+        self.head = 0
+        self.closed = False
+        self.clients = {}
+        self.client_ids = count(1)
+        self.upstream_connects = 0
+        self.upstream_bytes = 0
+        self.idle_since = time()
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name=f"relay-{name}", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """
+        Read the upstream into the buffer, fail over to the next url when the upstream breaks,
+        stop when there are no clients for a while
+        """
+        try:
+            failures = 0
+            while failures < len(self.urls) * constants.relay_upstream_retries:
+                if self.check_idle():
+                    return
+                url = self.urls[failures % len(self.urls)]
+                if self.read_upstream(url):
+                    failures = 0
+                else:
+                    failures += 1
+        finally:
+            http_client.release_session()
+            with self.condition:
+                self.closed = True
+                self.condition.notify_all()
+            if self.on_close:
+                self.on_close(self)
+
+    def read_upstream(self, url) -> bool:
+        """
+        Read the upstream url into the buffer, return True if any data was received
+        """
+        received = False
+        self.url = url
+        self.upstream_connects += 1
+        try:
+            with http_client.get(url, headers=headers, stream=True,
+                                 timeout=(constants.relay_connect_timeout, constants.relay_read_timeout)) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=constants.relay_chunk_size):
+                    if not chunk:
+                        continue
+                    received = True
+                    with self.condition:
+                        self.buffer.append(chunk)
+                        self.head += 1
+                        self.upstream_bytes += len(chunk)
+                        self.condition.notify_all()
+                    if self.check_idle():
+                        break
+        except Exception as e:
+            print(f"Relay {self.name} upstream {url} failed: {e}")
+        finally:
+            self.url = None
+        return received
+
+    def check_idle(self) -> bool:
+        """
+        Check if the relay has no clients for longer than the idle timeout
+        """
+        with self.condition:
+            if self.clients:
+                self.idle_since = time()
+                return False
+            return time() - self.idle_since > constants.relay_idle_timeout
+
+    def stream(self, client_addr=None):
+        """
+        Yield the chunks of the buffer to the client, skip ahead if the client falls behind the buffer
+        """
+        with self.condition:
+            client_id = next(self.client_ids)
+            position = max(self.head - constants.relay_preroll_chunks, self.head - len(self.buffer))
+            client = self.clients[client_id] = {"addr": client_addr, "position": position, "dropped": 0,
+                                                "start_time": time()}
+        try:
+            while True:
+                with self.condition:
+                    while client["position"] >= self.head and not self.closed:
+                        self.condition.wait(constants.relay_read_timeout)
+                    if client["position"] >= self.head:
+                        return
+                    oldest = self.head - len(self.buffer)
+                    if client["position"] < oldest:
+                        client["dropped"] += oldest - client["position"]
+                        client["position"] = oldest
+                    chunks = list(self.buffer)[client["position"] - oldest:]
+                    client["position"] = self.head
+                for chunk in chunks:
+                    yield chunk
+        finally:
+            with self.condition:
+                self.clients.pop(client_id, None)
+                self.idle_since = time()
+
+    def get_stats(self):
+        """
+        Get the stats of the relay with the lag of every client
+        """
+        with self.condition:
+            buffer_bytes = sum(len(chunk) for chunk in self.buffer)
+            clients = [
+                {
+                    "addr": client["addr"],
+                    "lag_chunks": self.head - client["position"],
+                    "dropped_chunks": client["dropped"],
+                    "duration": round(time() - client["start_time"], 1),
+                }
+                for client in self.clients.values()
+            ]
+        return {
+            "name": self.name,
+            "upstream_url": self.url,
+            "upstream_connected": self.url is not None,
+            "upstream_connects": self.upstream_connects,
+            "upstream_bytes": self.upstream_bytes,
+            "buffer_chunks": len(self.buffer),
+            "buffer_bytes": buffer_bytes,
+            "clients": clients,
+        }
+
+
+class StreamRelay:
+    """
+    Registry of the channel relays, every channel shares one upstream connection among its clients
+    """
+
+    def __init__(self):
+        self.channels = {}
+        self.lock = threading.Lock()
+
+    def get_channel(self, name, urls) -> RelayChannel:
+        """
+        Get the relay of the channel, start a new one if not running
+        """
+        with self.lock:
+            channel = self.channels.get(name)
+            if channel is None or channel.closed:
+                channel = self.channels[name] = RelayChannel(name, urls, on_close=self.remove_channel)
+        return channel
+
+    def remove_channel(self, channel):
+        with self.lock:
+            if self.channels.get(channel.name) is channel:
+                del self.channels[channel.name]
+
+    def get_stats(self):
+        """
+        Get the stats of all the running relays
+        """
+        with self.lock:
+            channels = list(self.channels.values())
+        stats = [channel.get_stats() for channel in channels]
+        return {
+            "upstream_connections": sum(1 for item in stats if item["upstream_connected"]),
+            "clients": sum(len(item["clients"]) for item in stats),
+            "channels": stats,
+        }
+
+
+stream_relay = StreamRelay()
+
+
+def get_relay_urls(urls):
+    """
+    Get the urls can be relayed as a continuous stream, the HLS playlists are excluded
+    """
+    return [
+        url for url in urls
+        if url.startswith(("http://", "https://")) and ".m3u8" not in url.lower()
+    ]
@@ -0,0 +1,265 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+import unicodedata
+from urllib.parse import quote
+
+from flask import make_response, request
+
+import utils.constants as constants
+from utils.channel import format_channel_name
+from utils.config import config
+from utils.tools import resource_path, get_resolution_value
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class ResultFileCache:
+    """
+    In-memory cache of the result files with the precomputed compressed bodies and the strong ETag,
+    swap in the new content when the file is replaced
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def load(path, stat_key):
+        """
+        Load the file and precompute the compressed bodies
+        """
+        with open(path, "rb") as file:
+            body = file.read()
+        bodies = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli:
+            bodies["br"] = brotli.compress(body)
+        return {"stat": stat_key, "bodies": bodies, "etag": hashlib.sha1(body).hexdigest()}
+
+    def get(self, path):
+        """
+        Get the cache entry of the file, reload it if the file changed
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        stat_key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        entry = self.entries.get(path)
+        if entry and entry["stat"] == stat_key:
+            return entry
+        with self.lock:
+            entry = self.entries.get(path)
+            if not entry or entry["stat"] != stat_key:
+                entry = self.load(path, stat_key)
+                self.entries[path] = entry
+        return entry
+
+
+result_file_cache = ResultFileCache()
+
+
+def get_accept_encoding(bodies):
+    """
+    Get the best encoding of the bodies accepted by the request
+    """
+    for encoding in ("br", "gzip"):
+        if encoding in bodies and request.accept_encodings[encoding] > 0:
+            return encoding
+    return "identity"
+
+
+def check_etag_match(etag):
+    """
+    Check if the If-None-Match header of the request matches the ETag
+    """
+    if_none_match = request.headers.get("If-None-Match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def get_download_name_options(download_name) -> dict[str, str]:
+    """
+    Get the filename options of the Content-Disposition header, add the RFC 5987 filename* for the non-ASCII name
+    """
+    try:
+        download_name.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", download_name).encode("ascii", "ignore").decode("ascii")
+        return {"filename": simple, "filename*": f"UTF-8''{quote(download_name, safe='!#$&+^`|~')}"}
+    return {"filename": download_name}
+
+
+def make_cached_response(entry, mimetype="text/plain", download_name=None):
+    """
+    Make the response of the cache entry, answer 304 if the client has the same content
+    """
+    encoding = get_accept_encoding(entry["bodies"])
+    etag = f'"{entry["etag"]}"' if encoding == "identity" else f'"{entry["etag"]}-{encoding}"'
+    if check_etag_match(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(entry["bodies"][encoding])
+        response.mimetype = mimetype
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        if download_name:
+            response.headers.set("Content-Disposition", "attachment", **get_download_name_options(download_name))
+    response.headers["ETag"] = etag
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def get_result_file_content(show_content=False, file_type=None):
+    """
+    Get the content of the result file from the memory
+    """
+    user_final_file = resource_path(config.final_file)
+    result_file = (
+        os.path.splitext(user_final_file)[0] + f".{file_type}"
+        if file_type
+        else user_final_file
+    )
+    download = False
+    if config.open_m3u_result and os.path.exists(result_file):
+        if file_type == "m3u" or not file_type:
+            result_file = os.path.splitext(user_final_file)[0] + ".m3u"
+        download = file_type != "txt" and show_content == False
+    entry = result_file_cache.get(result_file)
+    if entry is None:
+        response = make_response(constants.waiting_tip)
+        response.mimetype = "text/plain"
+        return response
+    if download:
+        return make_cached_response(
+            entry,
+            mimetype=mimetypes.guess_type(result_file)[0] or "application/octet-stream",
+            download_name=os.path.basename(result_file),
+        )
+    return make_cached_response(entry)
+
+
+class ResultDataIndex:
+    """
+    Lookup index of the result data json, rebuild when the file is replaced
+    """
+
+    def __init__(self, path=constants.result_data_path):
+        self.path = path
+        self.stat_key = None
+        self.index = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def build(data):
+        """
+        Build the index of the categories and the channels by name
+        """
+        categories = []
+        channels = []
+        by_name = {}
+        for cate in data.get("categories", []):
+            categories.append({"name": cate["name"], "channel_count": len(cate["channels"])})
+            for channel in cate["channels"]:
+                for url_data in channel["urls"]:
+                    url_data["resolution_value"] = get_resolution_value(url_data.get("resolution"))
+                item = {"name": channel["name"], "category": cate["name"], "urls": channel["urls"]}
+                channels.append(item)
+                by_name.setdefault(channel["name"], item)
+        return {
+            "update_time": data.get("update_time"),
+            "categories": categories,
+            "channels": channels,
+            "by_name": by_name,
+            "by_format_name": None,
+        }
+
+    def get(self):
+        """
+        Get the index, rebuild it if the result data changed
+        """
+        path = resource_path(self.path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        stat_key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if self.index is not None and self.stat_key == stat_key:
+            return self.index
+        with self.lock:
+            if self.index is None or self.stat_key != stat_key:
+                with open(path, "r", encoding="utf-8") as file:
+                    self.index = self.build(json.load(file))
+                self.stat_key = stat_key
+        return self.index
+
+
+result_data_index = ResultDataIndex()
+
+
+def get_channel_by_name(index, name):
+    """
+    Get the channel of the index by the name, fallback to the format name
+    """
+    channel = index["by_name"].get(name)
+    if channel is None:
+        if index["by_format_name"] is None:
+            by_format_name = {}
+            for channel_name, item in index["by_name"].items():
+                by_format_name.setdefault(format_channel_name(channel_name), item)
+            index["by_format_name"] = by_format_name
+        channel = index["by_format_name"].get(format_channel_name(name))
+    return channel
+
+
+def filter_channel_urls(urls, ipv_type=None, origin=None, min_resolution=None):
+    """
+    Filter the urls of the channel by the ipv type, origin and min resolution
+    """
+    min_resolution_value = get_resolution_value(min_resolution) if min_resolution else 0
+    return [
+        {key: value for key, value in url_data.items() if key != "resolution_value"}
+        for url_data in urls
+        if (not ipv_type or url_data.get("ipv_type") == ipv_type)
+        and (not origin or url_data.get("origin") == origin)
+        and url_data["resolution_value"] >= min_resolution_value
+    ]
+
+
+def get_channel_data(channel, **filters):
+    """
+    Get the channel data with the filtered urls
+    """
+    return {"name": channel["name"], "category": channel["category"],
+            "urls": filter_channel_urls(channel["urls"], **filters)}
+
+
+def get_channel_page(index, category=None, page=1, page_size=constants.api_page_size, **filters):
+    """
+    Get the page of the channels with the urls matching the filters
+    """
+    channels = [
+        channel_data
+        for channel in index["channels"]
+        if not category or channel["category"] == category
+        if (channel_data := get_channel_data(channel, **filters))["urls"]
+    ]
+    page = max(page, 1)
+    page_size = min(max(page_size, 1), constants.api_max_page_size)
+    start = (page - 1) * page_size
+    return {
+        "update_time": index["update_time"],
+        "total": len(channels),
+        "page": page,
+        "page_size": page_size,
+        "channels": channels[start:start + page_size],
+    }
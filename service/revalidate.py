@@ -0,0 +1,189 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+import utils.constants as constants
+from service.play import playback_selector
+from utils.channel import write_result_data
+from utils.config import config
+from utils.tools import resource_path, convert_to_m3u, add_url_info
+
+
+class ResultRevalidator:
+    """
+    Scheduler of the service re-probing the urls of the published result between the full updates,
+    the failed urls are replaced by the tested backup urls or moved to the end, the result files are updated in place
+    """
+
+    def __init__(self, interval=None):
+        self.interval = config.revalidate_interval * 60 if interval is None else interval
+        self.thread = None
+        self.executor = None
+        self.stop_event = threading.Event()
+        self.stats = {"runs": 0, "last_time": None, "last_duration": None, "probed": 0, "failed": 0,
+                      "replaced": 0, "demoted": 0}
+
+    def start(self):
+        """
+        Start the scheduler thread if the interval is set
+        """
+        if self.interval <= 0 or (self.thread and self.thread.is_alive()):
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="result-revalidator", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.executor:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.revalidate()
+            except Exception as e:
+                print(f"Revalidate result failed: {e}")
+
+    def probe(self, urls):
+        """
+        Probe the urls with the cheap health check, share the results with the playback health cache,
+        the executor lives across the runs so the worker threads keep reusing their http sessions
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=constants.revalidate_max_workers,
+                                               thread_name_prefix="result-revalidator")
+        results = dict(zip(urls, self.executor.map(playback_selector.check_url, urls)))
+        now = time()
+        with playback_selector.lock:
+            for url, healthy in results.items():
+                playback_selector.health[url] = (healthy, now)
+        return results
+
+    def revalidate_channel(self, channel, health):
+        """
+        Revalidate the urls of the channel, return True if the urls changed
+        """
+        healthy_urls, replaced_urls, failed_urls = [], [], []
+        for url_data in channel["urls"]:
+            if health.get(url_data["url"], True) or url_data.get("origin") == "whitelist":
+                healthy_urls.append(url_data)
+            else:
+                failed_urls.append(url_data)
+        if not failed_urls:
+            return False
+        backup_urls = channel.get("backup_urls", [])
+        remaining_backup_urls = []
+        for url_data in backup_urls:
+            if len(replaced_urls) < len(failed_urls) and playback_selector.check_health(url_data["url"]):
+                replaced_urls.append(url_data)
+            else:
+                remaining_backup_urls.append(url_data)
+        demoted_urls = failed_urls[len(replaced_urls):]
+        channel["urls"] = healthy_urls + replaced_urls + demoted_urls
+        channel["backup_urls"] = remaining_backup_urls + failed_urls[:len(replaced_urls)]
+        self.stats["failed"] += len(failed_urls)
+        self.stats["replaced"] += len(replaced_urls)
+        self.stats["demoted"] += len(demoted_urls)
+        return True
+
+    def revalidate(self):
+        """
+        Revalidate the published result once
+        """
+        path = resource_path(constants.result_data_path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        start_time = time()
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        categories = data.get("categories", [])
+        urls = list(dict.fromkeys(
+            url_data["url"] for cate in categories for channel in cate["channels"] for url_data in channel["urls"]
+        ))
+        health = self.probe(urls)
+        changed = {
+            (cate["name"], channel["name"]): channel["urls"]
+            for cate in categories
+            for channel in cate["channels"]
+            if self.revalidate_channel(channel, health)
+        }
+        self.stats["runs"] += 1
+        self.stats["probed"] += len(urls)
+        self.stats["last_time"] = start_time
+        self.stats["last_duration"] = round(time() - start_time, 3)
+        if not changed:
+            return
+        new_stat = os.stat(path)
+        if (new_stat.st_mtime_ns, new_stat.st_ino) != (stat.st_mtime_ns, stat.st_ino):
+            print("Result updated during the revalidation, skip writing")
+            return
+        write_result_data(categories, update_time=data.get("update_time"))
+        self.write_result_file(changed)
+        first_channel_name = next(
+            (channel["name"] for cate in categories for channel in cate["channels"]), None
+        )
+        convert_to_m3u(first_channel_name)
+        print(f"Revalidated result: {len(changed)} channels updated")
+
+    @staticmethod
+    def get_url_line(name, url_data, lines):
+        """
+        Get the result line of the url, keep the line of the old result if exists
+        """
+        line = lines.get(url_data["url"])
+        if line:
+            return line
+        url = url_data["url"]
+        if config.open_url_info:
+            url = add_url_info(url, constants.origin_map.get(url_data.get("origin")))
+            if url_data.get("ipv_type") == "ipv6":
+                url = add_url_info(url, "IPv6")
+            url = add_url_info(url, url_data.get("resolution"))
+        return f"{name},{url}"
+
+    def write_result_file(self, changed):
+        """
+        Rewrite the lines of the changed channels in the result file
+        """
+        path = resource_path(config.final_file)
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as file:
+            lines = file.read().split("\n")
+        channel_lines = {}
+        cate = None
+        for line in lines:
+            if "#genre#" in line:
+                cate = line.partition(",")[0]
+            elif line:
+                name, _, url = line.partition(",")
+                channel_lines.setdefault((cate, name), {})[url.partition("$")[0]] = line
+        content = []
+        written = set()
+        cate = None
+        for line in lines:
+            if "#genre#" in line:
+                cate = line.partition(",")[0]
+            elif line:
+                key = (cate, line.partition(",")[0])
+                if key in changed:
+                    if key not in written:
+                        written.add(key)
+                        content.extend(
+                            self.get_url_line(key[1], url_data, channel_lines[key]) for url_data in changed[key]
+                        )
+                    continue
+            content.append(line)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write("\n".join(content))
+        os.replace(tmp_path, path)
+
+
+result_revalidator = ResultRevalidator()
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(root_path)
+sys.path.insert(0, root_path)
+
+from utils.config import config
+
+
+@pytest.fixture
+def set_config():
+    """
+    Override the settings of the config, restore them after the test
+    """
+    old_values = {}
+
+    def set_value(key, value):
+        if key not in old_values:
+            old_values[key] = config.config.get("Settings", key, fallback=None)
+        config.config.set("Settings", key, str(value))
+
+    yield set_value
+    for key, value in old_values.items():
+        if value is None:
+            config.config.remove_option("Settings", key)
+        else:
+            config.config.set("Settings", key, value)
@@ -0,0 +1,26 @@
+import asyncio
+import re
+
+import updates.fofa.request as fofa_request
+
+
+def test_get_channels_by_fofa_without_driver(set_config, monkeypatch, capsys):
+    set_config("open_driver", False)
+    set_config("open_request", True)
+    set_config("open_use_cache", False)
+    set_config("open_proxy", False)
+    set_config("open_sort", False)
+    page = "<div>http://1.2.3.4:8080</div><!-- http://9.9.9.9:80 --><div>http://5.6.7.8:9000</div>"
+    monkeypatch.setattr(fofa_request, "get_source_requests", lambda url: page)
+    monkeypatch.setattr(fofa_request, "process_fofa_json_url",
+                        lambda url, region, open_sort, hotel_name="酒店源": {region: {"cctv1": [(url, None, None)]}})
+    monkeypatch.setattr(fofa_request, "get_fofa_region_result_tmp", lambda multicast=False: {})
+    monkeypatch.setattr(fofa_request, "update_fofa_region_result_tmp", lambda result, multicast=False: None)
+    monkeypatch.setattr(fofa_request.rate_limiter, "get_cooldown", lambda url: 0)
+
+    result = asyncio.run(fofa_request.get_channels_by_fofa(urls=[("https://fofa.info/result?qbase64=a", "北京")]))
+
+    hosts = {item[0] for item in result["北京"]["cctv1"]}
+    assert hosts == {"http://1.2.3.4:8080", "http://5.6.7.8:9000"}
+    stats = re.search(r"FOFA hotel json expansion: 2 hosts, 0 skipped, (\d+) threads, ", capsys.readouterr().out)
+    assert stats and 1 <= int(stats.group(1)) <= 2
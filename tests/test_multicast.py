@@ -0,0 +1,21 @@
+from utils.channel import get_channel_multicast_result
+
+
+def test_multicast_candidate_limit_covers_all_regions(set_config):
+    set_config("multicast_candidate_limit", 10)
+    set_config("open_sort", True)
+    result = {"cctv1": {
+        "北京": {"联通": [f"rtp://239.3.1.{n}:8000" for n in range(10)]},
+        "上海": {"电信": ["rtp://239.45.1.1:5140"]},
+    }}
+    search_result = {
+        "北京": {"联通": [(f"http://10.0.0.{n}:4022", None, None) for n in range(20)]},
+        "上海": {"电信": [("http://10.1.0.1:8888", None, None), ("http://10.1.0.2:8888", None, None)]},
+    }
+
+    urls = [info["url"] for info in get_channel_multicast_result(result, search_result)["cctv1"]]
+
+    assert len(urls) == 10
+    assert any("/rtp/239.45.1.1:5140" in url for url in urls)
+    assert len({url.partition("/rtp/")[2].partition("$")[0] for url in urls if "10.0.0." in url}) > 1
+    assert sum("10.1.0." in url for url in urls) == 2
@@ -0,0 +1,14 @@
+import utils.constants as constants
+from service.play import PlaybackSelector
+
+
+def test_expired_health_entries_are_removed(monkeypatch):
+    monkeypatch.setattr(constants, "play_max_health", 2)
+    selector = PlaybackSelector()
+    monkeypatch.setattr(selector, "check_url", lambda url: True)
+    for i in range(3):
+        selector.check_health(f"http://old{i}")
+    selector.health = {url: (healthy, checked - constants.play_health_ttl - 1)
+                       for url, (healthy, checked) in selector.health.items()}
+    selector.check_health("http://new")
+    assert set(selector.health) == {"http://new"}
@@ -0,0 +1,15 @@
+from flask import Flask
+
+from service.result import make_cached_response
+
+
+def test_download_name_is_quoted():
+    app = Flask(__name__)
+    entry = {"bodies": {"identity": b"#EXTM3U"}, "etag": "abc"}
+    with app.test_request_context():
+        plain = make_cached_response(entry, download_name="my result.m3u")
+        unicode = make_cached_response(entry, download_name="结果 1.m3u")
+    assert plain.headers["Content-Disposition"] == 'attachment; filename="my result.m3u"'
+    assert unicode.headers["Content-Disposition"] == (
+        "attachment; filename=\" 1.m3u\"; filename*=UTF-8''%E7%BB%93%E6%9E%9C%201.m3u"
+    )
@@ -0,0 +1,148 @@
+import asyncio
+import pickle
+import socket
+from time import time
+
+from aiohttp import ClientTimeout, web
+
+import utils.constants as constants
+import utils.speed as speed
+from utils.channel import process_sort_channel_list
+
+
+async def start_hanging_server():
+    async def handle(request):
+        await asyncio.sleep(5)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner, port
+
+
+def test_sort_time_budget_keeps_historic_result(set_config, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "output").mkdir()
+    set_config("sort_time_budget", 1)
+    set_config("open_incremental", False)
+    set_config("open_filter_resolution", False)
+    set_config("open_filter_speed", True)
+    set_config("open_supply", True)
+    old_cache = dict(speed.cache)
+    speed.cache.clear()
+
+    async def run():
+        runner, port = await start_hanging_server()
+        host = f"127.0.0.1:{port}"
+        historic = {"speed": 2.5, "delay": 100, "resolution": None}
+        with open(constants.speed_result_path, "wb") as file:
+            pickle.dump({host: {"time": time(), "results": [historic]}}, file)
+        data = {"Test": {"cctv1": [{
+            "url": f"http://{host}/live.m3u8$cache:{host}",
+            "date": None,
+            "resolution": None,
+            "origin": "subscribe",
+            "ipv_type": "ipv4",
+        }]}}
+        try:
+            result = await process_sort_channel_list(data)
+        finally:
+            await runner.cleanup()
+        return host, historic, result
+
+    try:
+        host, historic, result = asyncio.run(run())
+    finally:
+        speed.cache.clear()
+        speed.cache.update(old_cache)
+
+    store = speed.get_speed_result_store()
+    assert store[host]["results"] == [historic]
+    assert [info["url"] for info in result["Test"]["cctv1"]] == [f"http://{host}/live.m3u8"]
+
+
+def test_host_breaker_counts_only_unreachable(set_config):
+    set_config("sort_host_fail_limit", 2)
+    old_cache = dict(speed.cache)
+    speed.cache.clear()
+    speed.host_breaker.reset()
+
+    async def handle(request):
+        return web.Response(status=404)
+
+    async def run():
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            dead_port = sock.getsockname()[1]
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        try:
+            for i in range(3):
+                await speed.get_speed(f"http://127.0.0.1:{port}/{i}.m3u8$cache:live{i}", timeout=2)
+                await speed.get_speed(f"http://127.0.0.1:{dead_port}/{i}.m3u8$cache:dead{i}", timeout=2)
+        finally:
+            await runner.cleanup()
+        return port, dead_port
+
+    try:
+        port, dead_port = asyncio.run(run())
+        assert not speed.host_breaker.is_open(f"127.0.0.1:{port}")
+        assert speed.host_breaker.is_open(f"127.0.0.1:{dead_port}")
+        assert {"live0", "live1", "live2", "dead0", "dead1"} == set(speed.cache)
+    finally:
+        speed.cache.clear()
+        speed.cache.update(old_cache)
+        speed.host_breaker.reset()
+
+
+def test_host_latency_drops_expired_hosts(set_config, tmp_path):
+    set_config("host_cache_ttl", 1)
+    path = tmp_path / "host_latency.pkl"
+    history = speed.HostLatencyHistory(str(path))
+    history.record("old:80", 100)
+    history.record("new:80", 100)
+    history.history["old:80"]["time"] -= 2 * 86400
+    history.save()
+    history.load()
+    assert set(history.history) == {"new:80"}
+
+
+def test_host_timeout_does_not_limit_body_read():
+    async def handle(request):
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for _ in range(3):
+            await asyncio.sleep(0.4)
+            await response.write(b"0" * 1024)
+        return response
+
+    async def run():
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        try:
+            client_timeout = ClientTimeout(total=5, sock_connect=0.2, sock_read=0.2)
+            return await speed.get_speed_with_download(f"http://127.0.0.1:{port}/1.ts", timeout=5,
+                                                       client_timeout=client_timeout)
+        finally:
+            await runner.cleanup()
+
+    info = asyncio.run(run())
+    assert info["delay"] is not None and info["speed"] > 0
@@ -0,0 +1,25 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import utils.constants as constants
+from utils.trace import Tracer
+
+
+def profiled_worker_task(n):
+    return sum(i * i for i in range(n))
+
+
+def test_profile_includes_worker_threads(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    tracer = Tracer()
+    tracer.reset(profile_stage="fetch")
+    with tracer.span("fetch"):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(tracer.bind(profiled_worker_task, "task"), [10000] * 8))
+
+    stats_path = tmp_path / constants.run_profile_stats_path.format(name="fetch")
+    summary = stats_path.with_suffix(".txt").read_text(encoding="utf-8")
+    assert stats_path.exists()
+    assert "profiled_worker_task" in summary
+    span = tracer.root.to_dict()["children"][0]
+    assert len(span["children"]) == 8
+    assert "process_cpu" in span and "peak_rss_growth_mb" in span
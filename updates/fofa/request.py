@@ -1,21 +1,25 @@
 import pickle
 import re
 import threading
-from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from time import time
 
-from requests import get
 from tqdm.asyncio import tqdm_asyncio
 
 import updates.fofa.fofa_map as fofa_map
 import utils.constants as constants
 from updates.proxy import get_proxy, get_proxy_next
+from utils.cache import compact_host_cache
 from utils.channel import format_channel_name
 from utils.config import config
-from utils.requests.tools import get_source_requests, close_session
+from utils.driver.pool import driver_pool
+from utils.driver.tools import get_driver_page
+from utils.requests.client import http_client
+from utils.requests.rate_limit import rate_limiter
+from utils.requests.tools import get_source_requests
 from utils.retry import retry_func
 from utils.tools import merge_objects, get_pbar_remaining, add_url_info, resource_path
+from utils.trace import tracer
 
 
 def get_fofa_urls_from_region_list():
@@ -41,10 +45,10 @@ def get_fofa_urls_from_region_list():
 
 def update_fofa_region_result_tmp(result, multicast=False):
     """
-    Update fofa region result tmp
+    Update fofa region result tmp, compact the expired hosts on write
     """
     tmp_result = get_fofa_region_result_tmp(multicast=multicast)
-    total_result = merge_objects(tmp_result, result)
+    total_result = compact_host_cache(merge_objects(tmp_result, result))
     with open(
             resource_path(
                 f"updates/fofa/fofa_{'multicast' if multicast else 'hotel'}_region_result.pkl"
@@ -62,7 +66,7 @@ def get_fofa_region_result_tmp(multicast: False):
                 ),
                 "rb",
         ) as file:
-            return pickle.load(file)
+            return compact_host_cache(pickle.load(file))
     except:
         return {}
 
@@ -76,6 +80,12 @@ async def get_channels_by_fofa(urls=None, multicast=False, callback=None):
         fofa_results = get_fofa_region_result_tmp(multicast=multicast)
     if config.open_request:
         fofa_urls = urls if urls else get_fofa_urls_from_region_list()
+        cooling_urls = [fofa_info for fofa_info in fofa_urls if rate_limiter.get_cooldown(fofa_info[0])]
+        if cooling_urls:
+            fofa_urls = [fofa_info for fofa_info in fofa_urls if fofa_info not in cooling_urls]
+            print(f"Skip {len(cooling_urls)} FOFA urls of the cooling down hosts, use the cache instead")
+            if not fofa_results:
+                fofa_results = get_fofa_region_result_tmp(multicast=multicast)
         fofa_urls_len = len(fofa_urls)
         pbar = tqdm_asyncio(
             total=fofa_urls_len,
@@ -91,10 +101,8 @@ async def get_channels_by_fofa(urls=None, multicast=False, callback=None):
         proxy = None
         open_proxy = config.open_proxy
         open_driver = config.open_driver
-        if open_driver:
-            from utils.driver.setup import setup_driver
         open_sort = config.open_sort
-        if open_proxy:
+        if open_proxy and fofa_urls:
             test_url = fofa_urls[0][0]
             proxy = await get_proxy(test_url, best=True, with_test=True)
         cancel_event = threading.Event()
@@ -102,61 +110,40 @@ async def get_channels_by_fofa(urls=None, multicast=False, callback=None):
 
         def process_fofa_channels(fofa_info):
             nonlocal proxy
-            if cancel_event.is_set():
-                return {}
             fofa_url = fofa_info[0]
-            results = defaultdict(lambda: defaultdict(list))
+            if cancel_event.is_set() or rate_limiter.get_cooldown(fofa_url):
+                return set()
+            urls = set()
             driver = None
             try:
                 if open_driver:
-                    driver = setup_driver(proxy)
+                    driver = driver_pool.acquire(proxy)
                     try:
-                        retry_func(lambda: driver.get(fofa_url), name=fofa_url)
+                        retry_func(lambda: get_driver_page(driver, fofa_url), name=fofa_url)
                     except Exception as e:
                         if open_proxy:
-                            proxy = get_proxy_next()
-                        driver.close()
-                        driver.quit()
-                        driver = setup_driver(proxy)
-                        driver.get(fofa_url)
+                            proxy = get_proxy_next(proxy, fofa_url)
+                        driver_pool.release(driver, discard=True)
+                        driver = driver_pool.acquire(proxy)
+                        get_driver_page(driver, fofa_url)
                     page_source = driver.page_source
                 else:
                     page_source = retry_func(
                         lambda: get_source_requests(fofa_url), name=fofa_url
                     )
-                if any(keyword in page_source for keyword in ["访问异常", "禁止访问", "资源访问每天限制"]):
+                if rate_limiter.check_banned(content=page_source):
                     cancel_event.set()
                     raise ValueError("Limited access to fofa page")
                 fofa_source = re.sub(r"<!--.*?-->", "", page_source, flags=re.DOTALL)
-                urls = set(re.findall(r"https?://[\w\.-]+:\d+", fofa_source))
-                if multicast:
-                    region = fofa_info[1]
-                    type = fofa_info[2]
-                    multicast_result = [(url, None, None) for url in urls]
-                    results[region][type] = multicast_result
-                else:
-                    with ThreadPoolExecutor(max_workers=100) as executor:
-                        futures = [
-                            executor.submit(
-                                process_fofa_json_url,
-                                url,
-                                fofa_info[1],
-                                open_sort,
-                                hotel_name,
-                            )
-                            for url in urls
-                        ]
-                        for future in futures:
-                            results = merge_objects(results, future.result())
-                return results
+                urls = set(constants.host_port_url_pattern.findall(fofa_source))
+                return urls
             except ValueError as e:
                 raise e
             except Exception as e:
                 print(e)
+                return urls
             finally:
-                if driver:
-                    driver.close()
-                    driver.quit()
+                driver_pool.release(driver)
                 pbar.update()
                 remain = fofa_urls_len - pbar.n
                 if callback:
@@ -165,20 +152,55 @@ async def get_channels_by_fofa(urls=None, multicast=False, callback=None):
                         int((pbar.n / fofa_urls_len) * 100),
                     )
 
+        expanded_hosts = get_fofa_result_hosts(fofa_results) if not multicast else set()
+        skipped_hosts_num = 0
+        json_futures = []
+        json_executor = None if multicast else ThreadPoolExecutor(max_workers=constants.fofa_json_max_workers)
+        json_threads = set()
+
+        def process_json_url(*args):
+            json_threads.add(threading.get_ident())
+            return process_fofa_json_url(*args)
+
+        json_start_time = time()
         max_workers = 3 if open_driver else 10
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = [
-                executor.submit(process_fofa_channels, fofa_url) for fofa_url in fofa_urls
-            ]
+            futures = {
+                executor.submit(tracer.bind(process_fofa_channels, "fofa_url", url=fofa_info[0]), fofa_info): fofa_info
+                for fofa_info in fofa_urls
+            }
             try:
                 for future in as_completed(futures):
-                    result = future.result()
-                    if result:
-                        fofa_results = merge_objects(fofa_results, result)
+                    urls = future.result()
+                    if not urls:
+                        continue
+                    fofa_info = futures[future]
+                    if multicast:
+                        fofa_results = merge_objects(
+                            fofa_results, {fofa_info[1]: {fofa_info[2]: [(url, None, None) for url in urls]}}
+                        )
+                        continue
+                    for url in urls:
+                        if url in expanded_hosts:
+                            skipped_hosts_num += 1
+                            continue
+                        expanded_hosts.add(url)
+                        json_futures.append(
+                            json_executor.submit(process_json_url, url, fofa_info[1], open_sort, hotel_name)
+                        )
             except ValueError as e:
                 if "Limited access to fofa page" in str(e):
                     for future in futures:
                         future.cancel()
+        if json_executor:
+            for future in as_completed(json_futures):
+                fofa_results = merge_objects(fofa_results, future.result())
+            json_executor.shutdown()
+            json_time = time() - json_start_time
+            print(
+                f"FOFA hotel json expansion: {len(json_futures)} hosts, {skipped_hosts_num} skipped, "
+                f"{len(json_threads)} threads, {len(json_futures) / json_time if json_time > 0 else 0:.2f} hosts/s"
+            )
         if fofa_results:
             update_fofa_region_result_tmp(fofa_results, multicast=multicast)
         pbar.n = fofa_urls_len
@@ -188,12 +210,25 @@ async def get_channels_by_fofa(urls=None, multicast=False, callback=None):
                 f"正在获取Fofa{mode_name}源",
                 100,
             )
-        if not open_driver:
-            close_session()
         pbar.close()
     return fofa_results
 
 
+def get_fofa_result_hosts(result):
+    """
+    Get the hosts that have been expanded in the FOFA hotel result
+    """
+    hosts = set()
+    for info_list in result.values():
+        if not isinstance(info_list, list):
+            continue
+        for info in info_list:
+            matcher = constants.host_port_url_pattern.match(info.get("url", ""))
+            if matcher:
+                hosts.add(matcher.group())
+    return hosts
+
+
 def process_fofa_json_url(url, region, open_sort, hotel_name="酒店源"):
     """
     Process the FOFA json url
@@ -205,7 +240,7 @@ def process_fofa_json_url(url, region, open_sort, hotel_name="酒店源"):
         #     lambda: get(final_url, timeout=timeout),
         #     name=final_url,
         # )
-        response = get(final_url, timeout=config.request_timeout)
+        response = http_client.get(final_url, timeout=config.request_timeout)
         try:
             json_data = response.json()
             if json_data["code"] == 0:
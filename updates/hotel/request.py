@@ -1,3 +1,4 @@
+import os
 import pickle
 import urllib.parse as urlparse
 from collections import defaultdict
@@ -11,19 +12,21 @@ import updates.fofa.fofa_map as fofa_map
 import utils.constants as constants
 from updates.proxy import get_proxy, get_proxy_next
 from updates.subscribe import get_channels_by_subscribe_urls
+from utils.cache import compact_host_cache
 from utils.channel import (
     get_results_from_multicast_soup,
     get_results_from_multicast_soup_requests,
 )
 from utils.config import config
-from utils.driver.setup import setup_driver
-from utils.driver.tools import search_submit
-from utils.requests.tools import get_soup_requests, close_session
+from utils.driver.pool import driver_pool
+from utils.driver.tools import search_submit, get_driver_page
+from utils.requests.tools import get_soup_requests
 from utils.retry import (
     retry_func,
     find_clickable_element_with_retry,
 )
 from utils.tools import get_pbar_remaining, get_soup, merge_objects, resource_path
+from utils.trace import tracer
 
 if config.open_driver:
     try:
@@ -32,20 +35,40 @@ if config.open_driver:
         pass
 
 
+def get_hotel_cache():
+    """
+    Get the hotel cache, the shipped cache merged with the saved one, without the expired hosts
+    """
+    cache = {}
+    for path in ["updates/hotel/cache.pkl", constants.hotel_cache_path]:
+        try:
+            with open(resource_path(path), "rb") as file:
+                cache = merge_objects(cache, pickle.load(file) or {})
+        except:
+            pass
+    return compact_host_cache(cache)
+
+
+def update_hotel_cache(result):
+    """
+    Update the hotel cache with the request result, compact the expired hosts on write
+    """
+    if not result:
+        return
+    total_result = compact_host_cache(merge_objects(get_hotel_cache(), result))
+    path = resource_path(constants.hotel_cache_path, persistent=True)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        pickle.dump(total_result, file)
+
+
 async def get_channels_by_hotel(callback=None):
     """
     Get the channels by hotel
     """
     channels = {}
     if config.open_use_cache:
-        try:
-            with open(
-                    resource_path("updates/hotel/cache.pkl"),
-                    "rb",
-            ) as file:
-                channels = pickle.load(file) or {}
-        except:
-            pass
+        channels = get_hotel_cache()
     if config.open_request:
         page_url = constants.foodie_hotel_url
         proxy = None
@@ -66,19 +89,19 @@ async def get_channels_by_hotel(callback=None):
             driver = None
             try:
                 if open_driver:
-                    driver = setup_driver(proxy)
+                    driver = driver_pool.acquire(proxy)
                     try:
                         retry_func(
-                            lambda: driver.get(page_url),
+                            lambda: get_driver_page(driver, page_url),
                             name=f"Foodie hotel search:{name}",
+                            host=page_url,
                         )
                     except Exception as e:
                         if open_proxy:
-                            proxy = get_proxy_next()
-                        driver.close()
-                        driver.quit()
-                        driver = setup_driver(proxy)
-                        driver.get(page_url)
+                            proxy = get_proxy_next(proxy, page_url)
+                        driver_pool.release(driver, discard=True)
+                        driver = driver_pool.acquire(proxy)
+                        get_driver_page(driver, page_url)
                     search_submit(driver, name)
                 else:
                     page_soup = None
@@ -88,10 +111,11 @@ async def get_channels_by_hotel(callback=None):
                         page_soup = retry_func(
                             lambda: get_soup_requests(page_url, data=post_form, proxy=proxy),
                             name=f"Foodie hotel search:{name}",
+                            host=page_url,
                         )
                     except Exception as e:
                         if open_proxy:
-                            proxy = get_proxy_next()
+                            proxy = get_proxy_next(proxy, page_url, record=False)
                         page_soup = get_soup_requests(page_url, data=post_form, proxy=proxy)
                     if not page_soup:
                         print(f"{name}:Request fail.")
@@ -130,6 +154,7 @@ async def get_channels_by_hotel(callback=None):
                                 page_soup = retry_func(
                                     lambda: get_soup_requests(request_url, proxy=proxy),
                                     name=f"hotel search:{name}, page:{page}",
+                                    host=page_url,
                                 )
                         soup = get_soup(driver.page_source) if open_driver else page_soup
                         if soup:
@@ -157,9 +182,7 @@ async def get_channels_by_hotel(callback=None):
                 print(f"{name}:Error on search: {e}")
                 pass
             finally:
-                if driver:
-                    driver.close()
-                    driver.quit()
+                driver_pool.release(driver)
                 pbar.update()
                 if callback:
                     callback(
@@ -175,7 +198,7 @@ async def get_channels_by_hotel(callback=None):
         search_region_result = defaultdict(list)
         with ThreadPoolExecutor(max_workers=3) as executor:
             futures = {
-                executor.submit(process_region_by_hotel, region): region
+                executor.submit(tracer.bind(process_region_by_hotel, "region", region=region), region): region
                 for region in region_list
             }
 
@@ -198,7 +221,6 @@ async def get_channels_by_hotel(callback=None):
             urls, hotel=True, retry=False, error_print=False
         )
         channels = merge_objects(channels, request_channels)
-        if not open_driver:
-            close_session()
+        update_hotel_cache(request_channels)
         pbar.close()
     return channels
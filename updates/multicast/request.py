@@ -20,14 +20,15 @@ from utils.channel import (
     format_channel_name
 )
 from utils.config import config
-from utils.driver.setup import setup_driver
-from utils.driver.tools import search_submit
-from utils.requests.tools import get_soup_requests, close_session
+from utils.driver.pool import driver_pool
+from utils.driver.tools import search_submit, get_driver_page
+from utils.requests.tools import get_soup_requests
 from utils.retry import (
     retry_func,
     find_clickable_element_with_retry,
 )
 from utils.tools import get_pbar_remaining, get_soup, merge_objects, resource_path
+from utils.trace import tracer
 from .update_tmp import get_multicast_region_result_by_rtp_txt
 
 if config.open_driver:
@@ -82,18 +83,17 @@ async def get_channels_by_multicast(names, callback=None):
             driver = None
             try:
                 if open_driver:
-                    driver = setup_driver(proxy)
+                    driver = driver_pool.acquire(proxy)
                     try:
                         retry_func(
-                            lambda: driver.get(pageUrl), name=f"multicast search:{name}"
+                            lambda: get_driver_page(driver, pageUrl), name=f"multicast search:{name}", host=pageUrl
                         )
                     except Exception as e:
                         if open_proxy:
-                            proxy = get_proxy_next()
-                        driver.close()
-                        driver.quit()
-                        driver = setup_driver(proxy)
-                        driver.get(pageUrl)
+                            proxy = get_proxy_next(proxy, pageUrl)
+                        driver_pool.release(driver, discard=True)
+                        driver = driver_pool.acquire(proxy)
+                        get_driver_page(driver, pageUrl)
                     search_submit(driver, name)
                 else:
                     page_soup = None
@@ -103,10 +103,11 @@ async def get_channels_by_multicast(names, callback=None):
                         page_soup = retry_func(
                             lambda: get_soup_requests(pageUrl, data=post_form, proxy=proxy),
                             name=f"multicast search:{name}",
+                            host=pageUrl,
                         )
                     except Exception as e:
                         if open_proxy:
-                            proxy = get_proxy_next()
+                            proxy = get_proxy_next(proxy, pageUrl, record=False)
                         page_soup = get_soup_requests(pageUrl, data=post_form, proxy=proxy)
                     if not page_soup:
                         print(f"{name}:Request fail.")
@@ -140,6 +141,7 @@ async def get_channels_by_multicast(names, callback=None):
                                 page_soup = retry_func(
                                     lambda: get_soup_requests(request_url, proxy=proxy),
                                     name=f"multicast search:{name}, page:{page}",
+                                    host=pageUrl,
                                 )
                         soup = get_soup(driver.page_source) if open_driver else page_soup
                         if soup:
@@ -165,9 +167,7 @@ async def get_channels_by_multicast(names, callback=None):
                 print(f"{name}:Error on search: {e}")
                 pass
             finally:
-                if driver:
-                    driver.close()
-                    driver.quit()
+                driver_pool.release(driver)
                 pbar.update()
                 if callback:
                     callback(
@@ -187,7 +187,8 @@ async def get_channels_by_multicast(names, callback=None):
             start_time = time()
             with ThreadPoolExecutor(max_workers=3) as executor:
                 futures = {
-                    executor.submit(process_channel_by_multicast, region, type): (
+                    executor.submit(tracer.bind(process_channel_by_multicast, "region", region=region, type=type),
+                                    region, type): (
                         region,
                         type,
                     )
@@ -212,6 +213,4 @@ async def get_channels_by_multicast(names, callback=None):
             name_region_type_result, search_region_type_result
         )
         channels = merge_objects(channels, request_channels)
-        if not open_driver:
-            close_session()
     return channels
@@ -1,6 +1,10 @@
+import asyncio
+import os
+import pickle
 from concurrent.futures import ThreadPoolExecutor
 from time import time
 
+from aiohttp import ClientSession, ClientTimeout
 from tqdm.asyncio import tqdm_asyncio
 
 import utils.constants as constants
@@ -11,18 +15,23 @@ from utils.channel import (
     get_results_from_soup_requests,
 )
 from utils.config import config
-from utils.driver.setup import setup_driver
-from utils.driver.tools import search_submit
-from utils.requests.tools import get_soup_requests, close_session
+from utils.driver.pool import driver_pool
+from utils.driver.tools import search_submit, get_driver_page
+from utils.metrics import cache_requests_total
+from utils.trace import tracer
+from utils.requests.rate_limit import rate_limiter
+from utils.requests.tools import headers, report_proxy
 from utils.retry import (
     retry_func,
+    retry_async_func,
     find_clickable_element_with_retry,
 )
 from utils.tools import (
     get_pbar_remaining,
     get_soup,
     format_url_with_cache,
-    add_url_info
+    add_url_info,
+    resource_path
 )
 
 if config.open_driver:
@@ -32,6 +41,75 @@ if config.open_driver:
         pass
 
 
+def get_online_search_cache():
+    """
+    Get the online search cache, the results keyed by the normalized channel name
+    """
+    try:
+        with open(resource_path(constants.online_search_cache_path), "rb") as file:
+            return pickle.load(file) or {}
+    except:
+        return {}
+
+
+def update_online_search_cache(result):
+    """
+    Update the online search cache with the query result, remove the expired names on write
+    """
+    if not result:
+        return
+    now = time()
+    ttl = config.online_search_cache_ttl * 3600
+    cache = {
+        name: item
+        for name, item in get_online_search_cache().items()
+        if ttl <= 0 or now - item["time"] <= ttl
+    }
+    cache.update({name: {"time": now, "data": data} for name, data in result.items() if data})
+    path = resource_path(constants.online_search_cache_path, persistent=True)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        pickle.dump(cache, file)
+
+
+async def get_online_search_page(session, name, page=1, proxy=None):
+    """
+    Get the results of the online search page by requests, retry the suspected incomplete pages
+    """
+    page_url = constants.foodie_url
+    request_url = f"{page_url}?s={name}" if page == 1 else f"{page_url}?s={name}&page={page}"
+
+    async def get_page_source():
+        await rate_limiter.acquire_async(request_url)
+        start_time = time()
+        try:
+            async with session.get(request_url, proxy=proxy) as response:
+                source = await response.text()
+        except Exception:
+            if proxy:
+                report_proxy(proxy, request_url)
+            raise
+        if proxy:
+            report_proxy(proxy, request_url, int(round((time() - start_time) * 1000)) if response.ok else None)
+        rate_limiter.report(request_url, response.status, source)
+        if response.status in constants.retry_status_codes:
+            response.raise_for_status()
+        return source
+
+    for _ in range(1 if page == 1 else constants.online_search_page_retries):
+        source = await retry_async_func(
+            get_page_source, name=f"online search:{name}, page:{page}", host=page_url
+        )
+        soup = await asyncio.to_thread(get_soup, source)
+        if "About 0 results" in soup.text:
+            continue
+        results = get_results_from_soup_requests(soup, name)
+        print(name, "page:", page, "results num:", len(results))
+        if len(results) > 3:
+            return results
+    return []
+
+
 async def get_channels_by_online_search(names, callback=None):
     """
     Get the channels by online search
@@ -44,129 +122,126 @@ async def get_channels_by_online_search(names, callback=None):
     open_proxy = config.open_proxy
     open_driver = config.open_driver
     page_num = config.online_search_page_num
+    open_use_cache = config.open_use_cache
+    cache = get_online_search_cache() if open_use_cache else {}
+    cache_ttl = config.online_search_cache_ttl * 3600
+    now = time()
+    query_names = []
+    for name in names:
+        format_name = format_channel_name(name)
+        cache_item = cache.get(format_name)
+        if cache_ttl > 0 and cache_item and now - cache_item["time"] <= cache_ttl:
+            channels[format_name] = cache_item["data"]
+        else:
+            query_names.append(name)
+    cache_requests_total.inc(len(names) - len(query_names), cache="online_search", result="hit")
+    cache_requests_total.inc(len(query_names), cache="online_search", result="miss")
+    if len(query_names) < len(names):
+        print(f"Online search: {len(names) - len(query_names)} names from the cache, {len(query_names)} to query")
+    names = query_names
+    if not names:
+        return channels
     if open_proxy:
         proxy = await get_proxy(pageUrl, best=True, with_test=True)
     start_time = time()
     online_search_name = constants.origin_map["online_search"]
 
+    def get_info_list(results):
+        info_list = []
+        for result in results:
+            url = result["url"]
+            if url:
+                url = add_url_info(url, online_search_name)
+                url = format_url_with_cache(url)
+                info_list.append({
+                    "url": url,
+                    "date": result["date"],
+                    "resolution": result["resolution"],
+                })
+        return info_list
+
+    def update_progress():
+        pbar.update()
+        if callback:
+            callback(
+                f"正在进行线上查询, 剩余{names_len - pbar.n}个频道待查询, 预计剩余时间: {get_pbar_remaining(n=pbar.n, total=pbar.total, start_time=start_time)}",
+                int((pbar.n / names_len) * 100),
+            )
+
     def process_channel_by_online_search(name):
         nonlocal proxy
         info_list = []
         driver = None
         try:
-            if open_driver:
-                driver = setup_driver(proxy)
-                try:
-                    retry_func(
-                        lambda: driver.get(pageUrl), name=f"online search:{name}"
-                    )
-                except Exception as e:
-                    if open_proxy:
-                        proxy = get_proxy_next()
-                    driver.close()
-                    driver.quit()
-                    driver = setup_driver(proxy)
-                    driver.get(pageUrl)
-                search_submit(driver, name)
-            else:
-                page_soup = None
-                request_url = f"{pageUrl}?s={name}"
-                try:
-                    page_soup = retry_func(
-                        lambda: get_soup_requests(request_url, proxy=proxy),
-                        name=f"online search:{name}",
-                    )
-                except Exception as e:
-                    if open_proxy:
-                        proxy = get_proxy_next()
-                    page_soup = get_soup_requests(request_url, proxy=proxy)
-                if not page_soup:
-                    print(f"{name}:Request fail.")
-                    return
-            retry_limit = 3
+            driver = driver_pool.acquire(proxy)
+            try:
+                retry_func(
+                    lambda: get_driver_page(driver, pageUrl), name=f"online search:{name}", host=pageUrl
+                )
+            except Exception as e:
+                if open_proxy:
+                    proxy = get_proxy_next(proxy, pageUrl)
+                driver_pool.release(driver, discard=True)
+                driver = driver_pool.acquire(proxy)
+                get_driver_page(driver, pageUrl)
+            search_submit(driver, name)
+            retry_limit = constants.online_search_page_retries
             for page in range(1, page_num + 1):
                 retries = 0
-                if not open_driver and page == 1:
-                    retries = 2
                 while retries < retry_limit:
                     try:
                         if page > 1:
-                            if open_driver:
-                                page_link = find_clickable_element_with_retry(
-                                    driver,
-                                    (
-                                        By.XPATH,
-                                        f'//a[contains(@href, "={page}") and contains(@href, "{name}")]',
-                                    ),
-                                )
-                                if not page_link:
-                                    break
-                                driver.execute_script(
-                                    "arguments[0].click();", page_link
-                                )
-                            else:
-                                request_url = f"{pageUrl}?s={name}&page={page}"
-                                page_soup = retry_func(
-                                    lambda: get_soup_requests(request_url, proxy=proxy),
-                                    name=f"online search:{name}, page:{page}",
-                                )
-                        soup = (
-                            get_soup(driver.page_source) if open_driver else page_soup
-                        )
+                            page_link = find_clickable_element_with_retry(
+                                driver,
+                                (
+                                    By.XPATH,
+                                    f'//a[contains(@href, "={page}") and contains(@href, "{name}")]',
+                                ),
+                            )
+                            if not page_link:
+                                break
+                            driver.execute_script(
+                                "arguments[0].click();", page_link
+                            )
+                        soup = get_soup(driver.page_source)
                         if soup:
                             if "About 0 results" in soup.text:
                                 retries += 1
                                 continue
-                            results = (
-                                get_results_from_soup(soup, name)
-                                if open_driver
-                                else get_results_from_soup_requests(soup, name)
-                            )
+                            results = get_results_from_soup(soup, name)
                             print(name, "page:", page, "results num:", len(results))
                             if len(results) == 0:
                                 print(
                                     f"{name}:No results found, refreshing page and retrying..."
                                 )
-                                if open_driver:
-                                    driver.refresh()
+                                driver.refresh()
                                 retries += 1
                                 continue
                             elif len(results) <= 3:
-                                if open_driver:
-                                    next_page_link = find_clickable_element_with_retry(
-                                        driver,
-                                        (
-                                            By.XPATH,
-                                            f'//a[contains(@href, "={page + 1}") and contains(@href, "{name}")]',
-                                        ),
-                                        retries=1,
-                                    )
-                                    if next_page_link:
-                                        if open_proxy:
-                                            proxy = get_proxy_next()
-                                        driver.close()
-                                        driver.quit()
-                                        driver = setup_driver(proxy)
-                                        search_submit(driver, name)
+                                next_page_link = find_clickable_element_with_retry(
+                                    driver,
+                                    (
+                                        By.XPATH,
+                                        f'//a[contains(@href, "={page + 1}") and contains(@href, "{name}")]',
+                                    ),
+                                    retries=1,
+                                )
+                                if next_page_link:
+                                    if open_proxy:
+                                        proxy = get_proxy_next(proxy, pageUrl)
+                                    driver_pool.release(driver, discard=True)
+                                    driver = driver_pool.acquire(proxy)
+                                    get_driver_page(driver, pageUrl)
+                                    search_submit(driver, name)
                                 retries += 1
                                 continue
-                            for result in results:
-                                url = result["url"]
-                                if url:
-                                    url = add_url_info(url, online_search_name)
-                                    url = format_url_with_cache(url)
-                                    info_list.append({
-                                        "url": url,
-                                        "date": result["date"],
-                                        "resolution": result["resolution"],
-                                    })
+                            info_list.extend(get_info_list(results))
                             break
                         else:
                             print(
                                 f"{name}:No page soup found, refreshing page and retrying..."
                             )
-                            if open_driver:
-                                driver.refresh()
+                            driver.refresh()
                             retries += 1
                             continue
                     except Exception as e:
@@ -178,32 +253,65 @@ async def get_channels_by_online_search(names, callback=None):
             print(f"{name}:Error on search: {e}")
             pass
         finally:
-            if driver:
-                driver.close()
-                driver.quit()
-            pbar.update()
-            if callback:
-                callback(
-                    f"正在进行线上查询, 剩余{names_len - pbar.n}个频道待查询, 预计剩余时间: {get_pbar_remaining(n=pbar.n, total=pbar.total, start_time=start_time)}",
-                    int((pbar.n / names_len) * 100),
-                )
+            driver_pool.release(driver)
+            update_progress()
             return {"name": format_channel_name(name), "data": info_list}
 
+    async def search_channel_by_requests(session, semaphore, name):
+        nonlocal proxy
+        info_list = []
+        async with semaphore:
+            try:
+                try:
+                    results = await get_online_search_page(session, name, proxy=proxy)
+                except Exception as e:
+                    if not open_proxy:
+                        raise
+                    proxy = get_proxy_next(proxy, pageUrl, record=False)
+                    results = await get_online_search_page(session, name, proxy=proxy)
+                if results and page_num > 1:
+                    page_results = await asyncio.gather(
+                        *(get_online_search_page(session, name, page, proxy) for page in range(2, page_num + 1)),
+                        return_exceptions=True,
+                    )
+                    for page, result in enumerate(page_results, start=2):
+                        if isinstance(result, Exception):
+                            print(f"{name}:Error on page {page}: {result}")
+                        else:
+                            results.extend(result)
+                info_list = get_info_list(results)
+            except Exception as e:
+                print(f"{name}:Error on search: {e}")
+            finally:
+                update_progress()
+        return {"name": format_channel_name(name), "data": info_list}
+
     names_len = len(names)
     pbar = tqdm_asyncio(total=names_len, desc="Online search")
     if callback:
         callback(f"正在进行线上查询, 共{names_len}个频道", 0)
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        futures = [
-            executor.submit(process_channel_by_online_search, name) for name in names
-        ]
-        for future in futures:
-            result = future.result()
-            name = result.get("name")
-            data = result.get("data", [])
-            if name:
-                channels[name] = data
-    if not open_driver:
-        close_session()
+    if open_driver:
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [
+                executor.submit(tracer.bind(process_channel_by_online_search, "search", name=name), name)
+                for name in names
+            ]
+            results = [future.result() for future in futures]
+    else:
+        semaphore = asyncio.Semaphore(constants.online_search_max_concurrency)
+        async with ClientSession(headers=headers, timeout=ClientTimeout(total=config.request_timeout)) as session:
+            results = await asyncio.gather(
+                *(tracer.trace(search_channel_by_requests(session, semaphore, name), "search", name=name)
+                  for name in names)
+            )
+    query_result = {}
+    for result in results:
+        name = result.get("name")
+        data = result.get("data", [])
+        if name:
+            query_result[name] = data
+    channels.update(query_result)
+    if open_use_cache:
+        update_online_search_cache(query_result)
     pbar.close()
     return channels
@@ -1,34 +1,33 @@
+from .pool import proxy_pool
 from .request import get_proxy_list, get_proxy_list_with_test
 
 proxy_list = []
-proxy_list_test = []
-proxy_index = 0
+
+
 async def get_proxy(url=None, best=False, with_test=False):
   """
   Get the proxy
   """
-  global proxy_list, proxy_list_test, proxy_index
+  global proxy_list
+  url = url or "https://www.baidu.com"
   if not proxy_list:
     proxy_list = get_proxy_list(3)
-  if not proxy_list_test or with_test:
-    proxy_list_test = await get_proxy_list_with_test(url or "https://www.baidu.com", proxy_list)
-  if not proxy_list_test:
+  if not len(proxy_pool) or with_test:
+    await get_proxy_list_with_test(url, proxy_list)
+  if not len(proxy_pool):
     return None
+  proxy_pool.start_check(url)
   if best:
-    return proxy_list_test[0]
-  else:
-    proxy = proxy_list_test[proxy_index]
-    proxy_index = (proxy_index + 1) % len(proxy_list_test)
-    return proxy
-  
-def get_proxy_next():
+    return proxy_pool.get_best(url)
+  ranking = proxy_pool.get_ranking(url)
+  return ranking[0] if ranking else None
+
+
+def get_proxy_next(proxy=None, url=None, record=True):
   """
-  Get the next proxy
+  Get the next proxy, record the failure of the current proxy unless it is already reported by the request,
+  and return the best healthy one for the url
   """
-  global proxy_list_test, proxy_index
-  if not proxy_list_test:
-    return None
-  else:
-    proxy = proxy_list_test[proxy_index]
-    proxy_index = (proxy_index + 1) % len(proxy_list_test)
-    return proxy
\ No newline at end of file
+  if proxy and record:
+    proxy_pool.record(proxy, url)
+  return proxy_pool.get_best(url, exclude={proxy} if proxy else None)
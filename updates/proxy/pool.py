@@ -0,0 +1,139 @@
+import asyncio
+import threading
+from urllib.parse import urlparse
+
+import utils.constants as constants
+from utils.speed import get_delay_requests
+
+
+class ProxyPool:
+    """
+    Proxy pool, score the proxies by the EWMA of latency and success rate per target host
+    """
+
+    def __init__(self, alpha=constants.proxy_ewma_alpha, max_fails=constants.proxy_max_fails):
+        self.alpha = alpha
+        self.max_fails = max_fails
+        self.proxies = {}
+        self.lock = threading.Lock()
+        self.check_thread = None
+        self.check_url = None
+        self.stop_event = threading.Event()
+
+    @staticmethod
+    def get_host(url):
+        """
+        Get the target host of the url
+        """
+        return urlparse(url).netloc if url else None
+
+    def add(self, proxy):
+        """
+        Add the proxy to the pool
+        """
+        with self.lock:
+            self.proxies.setdefault(proxy, {})
+
+    def record(self, proxy, url=None, latency=None):
+        """
+        Record the result of the proxy to the target host, the latency is None means failed
+        """
+        if not proxy:
+            return
+        success = latency is not None and latency != -1
+        with self.lock:
+            if proxy not in self.proxies:
+                return
+            hosts = self.proxies[proxy]
+            for host in {None, self.get_host(url)}:
+                stats = hosts.get(host)
+                if stats is None:
+                    stats = hosts[host] = {
+                        "latency": latency if success else None,
+                        "success": 1.0 if success else 0.0,
+                        "fails": 0,
+                    }
+                else:
+                    stats["success"] += self.alpha * ((1.0 if success else 0.0) - stats["success"])
+                    if success:
+                        stats["latency"] = latency if stats["latency"] is None else (
+                                stats["latency"] + self.alpha * (latency - stats["latency"]))
+                stats["fails"] = 0 if success else stats["fails"] + 1
+            if hosts[None]["fails"] >= self.max_fails:
+                del self.proxies[proxy]
+
+    def get_score(self, stats):
+        """
+        Get the score of the proxy stats, higher is better
+        """
+        if not stats or stats["latency"] is None:
+            return 0
+        return stats["success"] / (1 + stats["latency"] / 1000)
+
+    def get_ranking(self, url=None, exclude=None):
+        """
+        Get the healthy proxies ranking by the score of the target host, fallback to the overall score
+        """
+        host = self.get_host(url)
+        with self.lock:
+            ranking = [
+                (proxy, self.get_score(hosts.get(host)), self.get_score(hosts.get(None)))
+                for proxy, hosts in self.proxies.items()
+                if not exclude or proxy not in exclude
+                if (hosts.get(None) or {}).get("success", 0) > 0
+            ]
+        ranking.sort(key=lambda item: (item[1], item[2]), reverse=True)
+        return [proxy for proxy, _, _ in ranking]
+
+    def get_best(self, url=None, exclude=None):
+        """
+        Get the best healthy proxy for the target host
+        """
+        ranking = self.get_ranking(url, exclude)
+        return ranking[0] if ranking else None
+
+    def __len__(self):
+        return len(self.proxies)
+
+    async def check(self, url, timeout=30):
+        """
+        Check all the proxies with the url and record the results
+        """
+        semaphore = asyncio.Semaphore(100)
+
+        async def check_proxy(proxy):
+            async with semaphore:
+                self.record(proxy, url, await get_delay_requests(url, timeout=timeout, proxy=proxy))
+
+        with self.lock:
+            proxies = list(self.proxies.keys())
+        await asyncio.gather(*(check_proxy(proxy) for proxy in proxies))
+
+    def start_check(self, url, interval=constants.proxy_check_interval):
+        """
+        Start the background check of the proxies
+        """
+        self.check_url = url or self.check_url
+        if self.check_thread and self.check_thread.is_alive():
+            return
+        self.stop_event.clear()
+
+        def run():
+            while not self.stop_event.wait(interval):
+                try:
+                    asyncio.run(self.check(self.check_url))
+                except Exception as e:
+                    print(f"Proxy check failed: {e}")
+
+        self.check_thread = threading.Thread(target=run, daemon=True)
+        self.check_thread.start()
+
+    def stop_check(self):
+        """
+        Stop the background check of the proxies
+        """
+        self.stop_event.set()
+        self.check_thread = None
+
+
+proxy_pool = ProxyPool()
@@ -4,9 +4,10 @@ from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 from tqdm.asyncio import tqdm_asyncio
 
+from updates.proxy.pool import proxy_pool
 from utils.config import config
 from utils.driver.tools import get_soup_driver
-from utils.requests.tools import get_soup_requests, close_session
+from utils.requests.tools import get_soup_requests
 from utils.retry import retry_func
 from utils.speed import get_delay_requests
 
@@ -56,15 +57,13 @@ def get_proxy_list(page_count=1):
         futures = [executor.submit(get_proxy, url) for url in urls]
         for future in futures:
             proxy_list.extend(future.result())
-    if not open_driver:
-        close_session()
     pbar.close()
     return proxy_list
 
 
 async def get_proxy_list_with_test(base_url, proxy_list):
     """
-    Get the proxy list with speed test
+    Get the proxy list with speed test, the results are recorded to the proxy pool
     """
     if not proxy_list:
         print("No valid proxy found")
@@ -79,10 +78,13 @@ async def get_proxy_list_with_test(base_url, proxy_list):
         *(get_speed_task(base_url, timeout=30, proxy=url) for url in proxy_list),
         desc="Testing proxy speed",
     )
+    for proxy, response_time in zip(proxy_list, response_times):
+        proxy_pool.add(proxy)
+        proxy_pool.record(proxy, base_url, response_time)
     proxy_list_with_test = [
         (proxy, response_time)
         for proxy, response_time in zip(proxy_list, response_times)
-        if response_time != float("inf")
+        if response_time != -1
     ]
     if not proxy_list_with_test:
         print("No valid proxy found")
@@ -2,12 +2,13 @@ from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor
 from time import time
 
-from requests import Session, exceptions
+from requests import exceptions
 from tqdm.asyncio import tqdm_asyncio
 
 import utils.constants as constants
 from utils.channel import format_channel_name
 from utils.config import config
+from utils.requests.client import http_client
 from utils.retry import retry_func
 from utils.tools import (
     merge_objects,
@@ -16,6 +17,7 @@ from utils.tools import (
     add_url_info,
     get_name_url
 )
+from utils.trace import tracer
 
 
 async def get_channels_by_subscribe_urls(
@@ -60,19 +62,18 @@ async def get_channels_by_subscribe_urls(
             subscribe_url = subscribe_info
         channels = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
         in_whitelist = whitelist and (subscribe_url in whitelist)
-        session = Session()
         try:
             response = None
             try:
                 response = (
                     retry_func(
-                        lambda: session.get(
+                        lambda: http_client.get(
                             subscribe_url, timeout=config.request_timeout
                         ),
                         name=subscribe_url,
                     )
                     if retry
-                    else session.get(subscribe_url, timeout=config.request_timeout)
+                    else http_client.get(subscribe_url, timeout=config.request_timeout)
                 )
             except exceptions.Timeout:
                 print(f"Timeout on subscribe: {subscribe_url}")
@@ -125,7 +126,6 @@ async def get_channels_by_subscribe_urls(
             if error_print:
                 print(f"Error on {subscribe_url}: {e}")
         finally:
-            session.close()
             pbar.update()
             remain = subscribe_urls_len - pbar.n
             if callback:
@@ -137,7 +137,8 @@ async def get_channels_by_subscribe_urls(
 
     with ThreadPoolExecutor(max_workers=100) as executor:
         futures = [
-            executor.submit(process_subscribe_channels, subscribe_url)
+            executor.submit(tracer.bind(process_subscribe_channels, "subscribe_url", source=subscribe_url),
+                            subscribe_url)
             for subscribe_url in urls
         ]
         for future in futures:
@@ -0,0 +1,117 @@
+import pickle
+import re
+from time import time
+
+import utils.constants as constants
+from utils.config import config
+from utils.tools import resource_path
+from utils.types import HostStateData, TestResultCacheData
+
+cache_key_pattern = re.compile(r"cache:(.*)")
+
+
+def get_cache_key(item) -> str | None:
+    """
+    Get the cache key (host) of the cache item, support url dict and (host, date, resolution) tuple
+    """
+    if isinstance(item, dict):
+        matcher = cache_key_pattern.search(item.get("url") or "")
+        return matcher.group(1) if matcher else None
+    if isinstance(item, (tuple, list)) and item:
+        host = item[0]
+        return host and (host.partition("://")[2] or host)
+    return None
+
+
+def get_host_state() -> HostStateData:
+    """
+    Get the host state data
+    """
+    try:
+        with open(resource_path(constants.host_state_path), "rb") as file:
+            return pickle.load(file) or {}
+    except:
+        return {}
+
+
+def check_host_state_expired(state, now=None) -> bool:
+    """
+    Check if the host state is expired by the fail limit and the TTL
+    """
+    now = now or time()
+    ttl = config.host_cache_ttl * 86400
+    fail_limit = config.host_cache_fail_limit
+    if fail_limit and state["fail_count"] >= fail_limit:
+        return True
+    if ttl <= 0:
+        return False
+    if state["last_alive"]:
+        return now - state["last_alive"] > ttl
+    return state["fail_count"] > 0 and now - state["first_seen"] > ttl
+
+
+def get_expired_host_keys(state_data: HostStateData = None) -> set[str]:
+    """
+    Get the expired host keys
+    """
+    state_data = get_host_state() if state_data is None else state_data
+    now = time()
+    return {key for key, state in state_data.items() if check_host_state_expired(state, now)}
+
+
+def update_host_state(seen_keys, test_result: TestResultCacheData = None):
+    """
+    Update the host state with the hosts seen and the test result of this run, compact and save
+    """
+    state_data = get_host_state()
+    now = time()
+    for key in seen_keys:
+        if not key:
+            continue
+        state = state_data.setdefault(key, {"first_seen": now, "last_seen": now, "last_alive": None, "fail_count": 0})
+        state["last_seen"] = now
+    for key, results in (test_result or {}).items():
+        if key not in state_data:
+            continue
+        state = state_data[key]
+        if any(result["delay"] is not None and result["delay"] != -1 for result in results):
+            state["last_alive"] = now
+            state["fail_count"] = 0
+        else:
+            state["fail_count"] += 1
+    ttl = config.host_cache_ttl * 86400
+    if ttl > 0:
+        state_data = {key: state for key, state in state_data.items() if now - state["last_seen"] <= ttl}
+    expired_num = len(get_expired_host_keys(state_data))
+    with open(resource_path(constants.host_state_path, persistent=True), "wb") as file:
+        pickle.dump(state_data, file)
+    print(f"Host state: {len(state_data)} hosts, {expired_num} expired")
+
+
+def compact_host_cache(data, expired_keys: set[str] = None):
+    """
+    Compact the cache data, remove the items of the expired hosts and the empty entries
+    """
+    expired_keys = get_expired_host_keys() if expired_keys is None else expired_keys
+    for key in list(data.keys()):
+        value = data[key]
+        if isinstance(value, dict):
+            compact_host_cache(value, expired_keys)
+        elif isinstance(value, list) and expired_keys:
+            data[key] = [item for item in value if get_cache_key(item) not in expired_keys]
+        if not data[key]:
+            del data[key]
+    return data
+
+
+def get_data_cache_keys(data) -> set[str]:
+    """
+    Get all the cache keys of the channel data
+    """
+    keys = set()
+    for value in data.values():
+        if isinstance(value, dict):
+            keys.update(get_data_cache_keys(value))
+        elif isinstance(value, list):
+            keys.update(key for item in value if (key := get_cache_key(item)))
+    return keys
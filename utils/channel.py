@@ -1,21 +1,33 @@
 import asyncio
 import base64
 import copy
+import json
+import math
 import os
 import pickle
-import re
-from collections import defaultdict
+from collections import defaultdict, deque
+from itertools import islice
 from logging import INFO
 
 from bs4 import NavigableString
 from opencc import OpenCC
 
 import utils.constants as constants
+from utils.cache import get_cache_key, get_data_cache_keys
 from utils.config import config
 from utils.speed import (
     get_speed,
     sort_urls,
-    check_ffmpeg_installed_status
+    check_ffmpeg_installed_status,
+    load_speed_result_cache,
+    update_speed_result_store,
+    load_sort_checkpoint,
+    append_sort_checkpoint,
+    remove_sort_checkpoint,
+    get_sort_priority_list,
+    host_breaker,
+    host_latency,
+    cache as speed_cache,
 )
 from utils.tools import (
     get_name_url,
@@ -32,6 +44,7 @@ from utils.tools import (
     format_url_with_cache,
     get_url_host, check_url_ipv6, check_ipv_type_match
 )
+from utils.trace import tracer
 from utils.types import ChannelData, OriginType, CategoryChannelData
 
 
@@ -157,6 +170,18 @@ def format_channel_name(name):
     return name.lower()
 
 
+def get_unique_channel_names(names: list[str]) -> list[str]:
+    """
+    Get the unique channel names by the format name, keep the shortest alias of each one for the query
+    """
+    unique_names = {}
+    for name in names:
+        format_name = format_channel_name(name)
+        if format_name not in unique_names or len(name) < len(unique_names[format_name]):
+            unique_names[format_name] = name
+    return list(unique_names.values())
+
+
 def channel_name_is_equal(name1, name2):
     """
     Check if the channel name is equal
@@ -197,8 +222,7 @@ def get_multicast_ip_list(urls):
     """
     ip_list = []
     for url in urls:
-        pattern = r"rtp://((\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})(?::(\d+))?)"
-        matcher = re.search(pattern, url)
+        matcher = constants.multicast_ip_pattern.search(url)
         if matcher:
             ip_list.append(matcher.group(1))
     return ip_list
@@ -248,32 +272,85 @@ def get_channel_multicast_region_type_list(result):
     return list(region_type_list)
 
 
-def get_channel_multicast_result(result, search_result):
+def get_multicast_search_host_index(search_result):
     """
-    Get the channel multicast info result by result and search result
+    Get the multicast search host index by region and type, dedupe the hosts once
+    """
+    host_index = {}
+    for region, region_obj in search_result.items():
+        for r_type, items in region_obj.items():
+            hosts = {}
+            for item in items:
+                if isinstance(item, dict):
+                    host, date, resolution = item.get("url"), item.get("date"), item.get("resolution")
+                else:
+                    host, date, resolution = item
+                host = host and (host.partition("://")[2] or host)
+                if host and host not in hosts:
+                    hosts[host] = (host, date, resolution)
+            if hosts:
+                host_index[(region, r_type)] = list(hosts.values())
+    return host_index
+
+
+def interleave(iterables):
+    """
+    Yield the items of the iterables in round-robin order, lazily
+    """
+    iterators = deque(iter(iterable) for iterable in iterables)
+    while iterators:
+        iterator = iterators.popleft()
+        try:
+            yield next(iterator)
+        except StopIteration:
+            continue
+        iterators.append(iterator)
+
+
+def generate_channel_multicast_info(result_obj, host_index):
+    """
+    Generate the channel multicast info lazily from the host index, interleaved by region, type and ip
+    so that the candidate limit covers all of them
     """
-    info_result = {}
     multicast_name = constants.origin_map["multicast"]
-    for name, result_obj in result.items():
-        info_list = [
-            {
-                "url":
-                    add_url_info(
-                        total_url,
-                        f"{result_region}{result_type}{multicast_name}{('-cache:' + url) if config.open_sort else ''}",
-                    ),
+    open_sort = config.open_sort
+
+    def generate_ip_info(info, ip, hosts):
+        for host, date, resolution in hosts:
+            yield {
+                "url": add_url_info(
+                    f"http://{host}/rtp/{ip}",
+                    f"{info}-cache:{host}" if open_sort else info,
+                ),
                 "date": date,
                 "resolution": resolution,
             }
-            for result_region, result_types in result_obj.items()
-            if result_region in search_result
-            for result_type, result_type_urls in result_types.items()
-            if result_type in search_result[result_region]
-            for ip in get_multicast_ip_list(result_type_urls) or []
-            for url, date, resolution in search_result[result_region][result_type]
-            if (total_url := f"http://{url}/rtp/{ip}")
-        ]
-        info_result[name] = info_list
+
+    def generate_type_info(region, r_type, urls, hosts):
+        info = f"{region}{r_type}{multicast_name}"
+        return interleave(generate_ip_info(info, ip, hosts) for ip in dict.fromkeys(get_multicast_ip_list(urls)))
+
+    def generate_region_info(region, types):
+        return interleave(
+            generate_type_info(region, r_type, urls, hosts)
+            for r_type, urls in types.items()
+            if (hosts := host_index.get((region, r_type)))
+        )
+
+    return interleave(generate_region_info(region, types) for region, types in result_obj.items())
+
+
+def get_channel_multicast_result(result, search_result):
+    """
+    Get the channel multicast info result by result and search result
+    """
+    info_result = {}
+    host_index = get_multicast_search_host_index(search_result)
+    if not host_index:
+        return info_result
+    limit = config.multicast_candidate_limit or None
+    for name, result_obj in result.items():
+        info_result[name] = list(islice(generate_channel_multicast_info(result_obj, host_index), limit))
     return info_result
 
 
@@ -644,9 +721,9 @@ def append_total_data(
                         print_channel_number(data, cate, name)
 
 
-async def process_sort_channel_list(data, ipv6=False, callback=None):
+async def process_sort_channel_list(data, ipv6=False, callback=None, resume=False):
     """
-    Process the sort channel list
+    Process the sort channel list, resume from the checkpoint of the interrupted run if resume
     """
     ipv6_proxy_url = None if (not config.open_ipv6 or ipv6) else constants.ipv6_proxy
     open_filter_resolution = config.open_filter_resolution
@@ -661,12 +738,30 @@ async def process_sort_channel_list(data, ipv6=False, callback=None):
     async def limited_get_speed(url, is_ipv6, ipv6_proxy, resolution, filter_resolution, min_resolution, timeout,
                                 callback):
         async with semaphore:
-            return await get_speed(url, is_ipv6=is_ipv6, ipv6_proxy=ipv6_proxy,
-                                   resolution=resolution, filter_resolution=filter_resolution,
-                                   min_resolution=min_resolution, timeout=timeout,
-                                   callback=callback)
-
-    tasks = [
+            cache_key = get_cache_key({"url": url})
+            tested = cache_key and cache_key not in speed_cache
+            test_result = await get_speed(url, is_ipv6=is_ipv6, ipv6_proxy=ipv6_proxy,
+                                          resolution=resolution, filter_resolution=filter_resolution,
+                                          min_resolution=min_resolution, timeout=timeout,
+                                          callback=callback)
+            if tested and cache_key in speed_cache:
+                append_sort_checkpoint(checkpoint_file, cache_key, test_result)
+            return test_result
+
+    host_breaker.reset()
+    host_latency.load()
+    if resume:
+        print(f"Resume sort: {load_sort_checkpoint()} hosts from the checkpoint")
+    else:
+        remove_sort_checkpoint()
+    loaded_keys = set()
+    if config.open_incremental:
+        sort_keys = get_data_cache_keys(need_sort_data)
+        loaded_keys = load_speed_result_cache(sort_keys)
+        print(f"Incremental update: {len(loaded_keys)} hosts reuse the last result, "
+              f"{len(sort_keys) - len(loaded_keys)} hosts need to be tested")
+    sort_time_budget = config.sort_time_budget
+    tasks = {
         asyncio.create_task(
             limited_get_speed(
                 info["url"],
@@ -678,28 +773,47 @@ async def process_sort_channel_list(data, ipv6=False, callback=None):
                 timeout=sort_timeout,
                 callback=callback,
             )
-        )
-        for channel_obj in need_sort_data.values()
-        for info_list in channel_obj.values()
-        for info in info_list
-    ]
-    await asyncio.gather(*tasks)
+        ): info
+        for info in get_sort_priority_list(need_sort_data)
+    }
+    pending = set()
+    if not os.path.exists(constants.output_path):
+        os.makedirs(constants.output_path)
+    with (open(resource_path(constants.sort_checkpoint_path, persistent=True), "a", encoding="utf-8") as checkpoint_file,
+          tracer.span("speed_test", urls=len(tasks))):
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=sort_time_budget or None)
+        if pending:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+    remove_sort_checkpoint()
+    host_latency.save()
+    if pending:
+        pending_keys = {key for task in pending if (key := get_cache_key(tasks[task]))}
+        fallback_keys = load_speed_result_cache(pending_keys, fresh=False)
+        loaded_keys |= fallback_keys
+        print(f"Sort time budget {sort_time_budget}s reached, {len(pending)} urls not tested, "
+              f"{len(fallback_keys)} hosts use the historic result")
+    update_speed_result_store(loaded_keys)
     logger = get_logger(constants.sort_log_path, level=INFO, init=True)
+    host_breaker.log_state(logger)
     open_supply = config.open_supply
     open_filter_speed = config.open_filter_speed
     min_speed = config.min_speed
-    for cate, obj in data.items():
-        for name, info_list in obj.items():
-            info_list = sort_urls(name, info_list, supply=open_supply, filter_speed=open_filter_speed,
-                                  min_speed=min_speed, filter_resolution=open_filter_resolution,
-                                  min_resolution=min_resolution_value, logger=logger)
-            append_data_to_info_data(
-                result,
-                cate,
-                name,
-                info_list,
-                check=False,
-            )
+    with tracer.span("sort_urls"):
+        for cate, obj in data.items():
+            for name, info_list in obj.items():
+                info_list = sort_urls(name, info_list, supply=open_supply, filter_speed=open_filter_speed,
+                                      min_speed=min_speed, filter_resolution=open_filter_resolution,
+                                      min_resolution=min_resolution_value, logger=logger)
+                append_data_to_info_data(
+                    result,
+                    cate,
+                    name,
+                    info_list,
+                    check=False,
+                )
     logger.handlers.clear()
     return result
 
@@ -720,10 +834,13 @@ def write_channel_to_file(data, ipv6=False, callback=None):
         origin_type_prefer = config.origin_type_prefer
         first_cate = True
         content = ""
+        result_data = []
         for cate, channel_obj in data.items():
             print(f"\n{cate}:", end=" ")
             content += f"{'\n\n' if not first_cate else ''}{cate},#genre#"
             first_cate = False
+            cate_data = {"name": cate, "channels": []}
+            result_data.append(cate_data)
             channel_obj_keys = channel_obj.keys()
             names_len = len(list(channel_obj_keys))
             for i, name in enumerate(channel_obj_keys):
@@ -735,6 +852,11 @@ def write_channel_to_file(data, ipv6=False, callback=None):
                     if open_empty_category:
                         no_result_name.append(name)
                     continue
+                cate_data["channels"].append({
+                    "name": name,
+                    "urls": get_channel_url_data(info_list, channel_urls),
+                    "backup_urls": get_channel_backup_url_data(info_list, channel_urls),
+                })
                 for url in channel_urls:
                     content += f"\n{name},{url}"
                     if callback:
@@ -761,10 +883,63 @@ def write_channel_to_file(data, ipv6=False, callback=None):
                 content += f"\n\n🕘️更新时间,#genre#\n{get_datetime_now()},{update_time_url}"
         with open(path, "w", encoding="utf-8") as f:
             f.write(content)
+        write_result_data(result_data)
     except Exception as e:
         print(f"❌ Write channel to file failed: {e}")
 
 
+def get_channel_url_data(info_list, channel_urls) -> list[dict]:
+    """
+    Get the url data of the channel in the order of the result urls, with the test metadata
+    """
+    info_map = {}
+    for info in info_list:
+        info_map.setdefault(info["url"].partition("$")[0], info)
+    url_data = []
+    for url in channel_urls:
+        pure_url = url.partition("$")[0]
+        info = info_map.get(pure_url, {})
+        speed = info.get("speed")
+        url_data.append({
+            "url": pure_url,
+            "speed": round(speed, 3) if isinstance(speed, (int, float)) and math.isfinite(speed) else None,
+            "delay": info.get("delay"),
+            "resolution": info.get("resolution"),
+            "origin": info.get("origin"),
+            "ipv_type": info.get("ipv_type"),
+            "date": info.get("date"),
+        })
+    return url_data
+
+
+def get_channel_backup_url_data(info_list, channel_urls) -> list[dict]:
+    """
+    Get the url data of the tested urls not in the result, used to replace the failed result urls
+    """
+    result_urls = {url.partition("$")[0] for url in channel_urls}
+    backup_urls = []
+    for info in info_list:
+        url = info["url"].partition("$")[0]
+        if url not in result_urls and info.get("origin") != "whitelist":
+            result_urls.add(url)
+            backup_urls.append(url)
+            if len(backup_urls) >= constants.result_backup_size:
+                break
+    return get_channel_url_data(info_list, backup_urls)
+
+
+def write_result_data(result_data, update_time=None):
+    """
+    Write the result data with the test metadata to the json file, replace the old file atomically
+    """
+    path = resource_path(constants.result_data_path, persistent=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump({"update_time": update_time or get_datetime_now(), "categories": result_data}, file,
+                  ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
 def get_multicast_fofa_search_org(region, org_type):
     """
     Get the fofa search organization for multicast
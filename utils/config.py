@@ -248,6 +248,14 @@ class ConfigManager:
     def open_history(self):
         return self.config.getboolean("Settings", "open_history", fallback=True)
 
+    @property
+    def open_incremental(self):
+        return self.config.getboolean("Settings", "open_incremental", fallback=False)
+
+    @property
+    def incremental_ttl(self):
+        return self.config.getint("Settings", "incremental_ttl", fallback=24)
+
     @property
     def open_sort(self):
         return self.config.getboolean("Settings", "open_sort", fallback=True)
@@ -276,10 +284,33 @@ class ConfigManager:
             if region.strip()
         ]
 
+    @property
+    def request_rate_limit(self):
+        rates = {}
+        for item in self.config.get("Settings", "request_rate_limit", fallback="").split(","):
+            host, _, rate = item.strip().rpartition(":")
+            try:
+                rates[host.strip()] = float(rate)
+            except ValueError:
+                continue
+        return {host: rate for host, rate in rates.items() if host}
+
     @property
     def request_timeout(self):
         return self.config.getint("Settings", "request_timeout", fallback=10)
 
+    @property
+    def revalidate_interval(self):
+        return self.config.getint("Settings", "revalidate_interval", fallback=0)
+
+    @property
+    def sort_host_fail_limit(self):
+        return self.config.getint("Settings", "sort_host_fail_limit", fallback=3)
+
+    @property
+    def sort_time_budget(self):
+        return self.config.getint("Settings", "sort_time_budget", fallback=0)
+
     @property
     def sort_timeout(self):
         return self.config.getint("Settings", "sort_timeout", fallback=10)
@@ -294,14 +325,30 @@ class ConfigManager:
             "Settings", "open_driver", fallback=True
         )
 
+    @property
+    def host_cache_ttl(self):
+        return self.config.getint("Settings", "host_cache_ttl", fallback=7)
+
+    @property
+    def host_cache_fail_limit(self):
+        return self.config.getint("Settings", "host_cache_fail_limit", fallback=3)
+
     @property
     def hotel_page_num(self):
         return self.config.getint("Settings", "hotel_page_num", fallback=1)
 
+    @property
+    def multicast_candidate_limit(self):
+        return self.config.getint("Settings", "multicast_candidate_limit", fallback=100)
+
     @property
     def multicast_page_num(self):
         return self.config.getint("Settings", "multicast_page_num", fallback=1)
 
+    @property
+    def online_search_cache_ttl(self):
+        return self.config.getint("Settings", "online_search_cache_ttl", fallback=24)
+
     @property
     def online_search_page_num(self):
         return config.getint("Settings", "online_search_page_num", fallback=1)
@@ -13,10 +13,46 @@ subscribe_path = os.path.join(config_path, "subscribe.txt")
 
 result_path = os.path.join(output_path, "result_new.txt")
 
+result_data_path = os.path.join(output_path, "result_data.json")
+
 cache_path = os.path.join(output_path, "cache.pkl")
 
+host_state_path = os.path.join(output_path, "host_state.pkl")
+
+speed_result_path = os.path.join(output_path, "speed_result.pkl")
+
+sort_checkpoint_path = os.path.join(output_path, "sort_checkpoint.jsonl")
+
+host_latency_path = os.path.join(output_path, "host_latency.pkl")
+
+online_search_cache_path = os.path.join(output_path, "online_search_cache.pkl")
+
+hotel_cache_path = os.path.join(output_path, "hotel_cache.pkl")
+
+sort_checkpoint_ttl = 86400
+
+host_latency_history_size = 20
+
+host_latency_min_samples = 3
+
+adaptive_timeout_factor = 3
+
+adaptive_timeout_min = 1
+
+sort_origin_priority = ["whitelist", "local", "subscribe", "hotel", "multicast", "online_search"]
+
+rate_limit_path = os.path.join(output_path, "rate_limit.pkl")
+
 sort_log_path = os.path.join(output_path, "sort.log")
 
+hls_cache_path = os.path.join(output_path, "hls_cache")
+
+metrics_path = os.path.join(output_path, "metrics.prom")
+
+run_profile_path = os.path.join(output_path, "run_profile.json")
+
+run_profile_stats_path = os.path.join(output_path, "profile_{name}.prof")
+
 log_path = os.path.join(output_path, "log.log")
 
 url_host_pattern = re.compile(r"((https?|rtmp)://)?(\[[0-9a-fA-F:]+]|([\w-]+\.)+[\w-]+)")
@@ -25,8 +61,12 @@ url_pattern = re.compile(url_host_pattern.pattern + r"(.*)?")
 
 rtmp_url_pattern = re.compile(r"^rtmp://.*$")
 
+host_port_url_pattern = re.compile(r"https?://[\w.-]+:\d+")
+
 rtp_pattern = re.compile(r"^([^,，]+)[,，]?(rtp://.*)$")
 
+multicast_ip_pattern = re.compile(r"rtp://((\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})(?::(\d+))?)")
+
 demo_txt_pattern = re.compile(r"^([^,，]+)[,，]?(?!#genre#)" + r"(" + url_pattern.pattern + r")?")
 
 txt_pattern = re.compile(r"^([^,，]+)[,，](?!#genre#)" + r"(" + url_pattern.pattern + r")")
@@ -119,4 +159,98 @@ foodie_url = "http://www.foodieguide.com/iptvsearch/"
 
 foodie_hotel_url = "http://www.foodieguide.com/iptvsearch/hoteliptv.php"
 
+retry_base_delay = 0.5
+
+retry_max_delay = 8
+
+retry_host_budget = 20
+
+retry_status_codes = {429, 500, 502, 503, 504}
+
+driver_pool_size = 3
+
+proxy_ewma_alpha = 0.3
+
+proxy_max_fails = 3
+
+proxy_check_interval = 60
+
+driver_max_uses = 20
+
+ban_keywords = ["访问异常", "禁止访问", "资源访问每天限制"]
+
+ban_status_codes = {403, 429}
+
+ban_cooldown = 60
+
+ban_max_cooldown = 86400
+
+request_pool_connections = 100
+
+request_host_max_connections = 10
+
+online_search_max_concurrency = 10
+
+online_search_page_retries = 3
+
+request_host_connections = {"fofa.info": 3, "www.zoomeye.org": 3, "www.foodieguide.com": 5}
+
+fofa_json_max_workers = 50
+
+result_backup_size = 10
+
+api_page_size = 50
+
+api_max_page_size = 200
+
+play_health_timeout = 2
+
+play_health_ttl = 30
+
+play_retry_window = 10
+
+play_max_checks = 3
+
+play_max_clients = 10000
+
+play_max_health = 10000
+
+relay_chunk_size = 188 * 348
+
+relay_buffer_chunks = 256
+
+relay_preroll_chunks = 16
+
+relay_connect_timeout = 5
+
+relay_read_timeout = 15
+
+relay_idle_timeout = 10
+
+relay_upstream_retries = 2
+
+hls_request_timeout = 10
+
+hls_playlist_max_ttl = 5
+
+hls_segment_max_age = 300
+
+hls_memory_cache_size = 64 * 1024 * 1024
+
+hls_disk_cache_size = 512 * 1024 * 1024
+
+hls_max_uris = 20000
+
+revalidate_max_workers = 10
+
+metrics_seconds_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+metrics_long_seconds_buckets = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+metrics_speed_buckets = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50)
+
+metrics_lag_buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+event_loop_lag_interval = 0.5
+
 waiting_tip = "🔍️未找到结果文件，若已启动更新，请耐心等待更新完成..."
@@ -0,0 +1,134 @@
+import threading
+from time import time
+
+import utils.constants as constants
+from utils.driver.setup import setup_driver
+
+
+class DriverPool:
+    """
+    Pool of warm drivers, reset the driver state between uses and recycle it after the max uses or the proxy changes
+    """
+
+    def __init__(self, size=constants.driver_pool_size, max_uses=constants.driver_max_uses):
+        self.size = size
+        self.max_uses = max_uses
+        self.idle = []
+        self.driver_info = {}
+        self.lock = threading.Lock()
+        self.semaphore = threading.BoundedSemaphore(size)
+        self.launch_count = 0
+        self.acquire_count = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.busy_time = 0
+        self.start_time = None
+
+    def acquire(self, proxy=None):
+        """
+        Acquire a warm driver with the proxy, launch a new one if there is no idle driver for the proxy
+        """
+        self.semaphore.acquire()
+        driver = None
+        stale_driver = None
+        with self.lock:
+            for index, idle_driver in enumerate(self.idle):
+                if self.driver_info[id(idle_driver)]["proxy"] == proxy:
+                    driver = self.idle.pop(index)
+                    break
+            else:
+                if self.idle:
+                    stale_driver = self.idle.pop(0)
+        if stale_driver:
+            self.quit(stale_driver)
+        if driver is None:
+            try:
+                driver = setup_driver(proxy)
+            except Exception:
+                self.semaphore.release()
+                raise
+            with self.lock:
+                self.launch_count += 1
+                self.driver_info[id(driver)] = {"proxy": proxy, "uses": 0, "acquire_time": None}
+        with self.lock:
+            now = time()
+            self.start_time = self.start_time or now
+            self.driver_info[id(driver)]["acquire_time"] = now
+            self.acquire_count += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+        return driver
+
+    def release(self, driver, discard=False):
+        """
+        Release the driver to the pool, quit it if discard or it reaches the max uses
+        """
+        if driver is None:
+            return
+        with self.lock:
+            info = self.driver_info.get(id(driver))
+            if info is None:
+                return
+            info["uses"] += 1
+            self.busy_time += time() - info["acquire_time"]
+            self.in_use -= 1
+            recycle = discard or info["uses"] >= self.max_uses
+        try:
+            if not recycle:
+                try:
+                    driver.delete_all_cookies()
+                    driver.get("about:blank")
+                except Exception:
+                    recycle = True
+            if recycle:
+                self.quit(driver)
+            else:
+                with self.lock:
+                    self.idle.append(driver)
+        finally:
+            self.semaphore.release()
+
+    def quit(self, driver):
+        """
+        Quit the driver and remove it from the pool
+        """
+        with self.lock:
+            self.driver_info.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def get_stats(self):
+        """
+        Get the stats of the pool
+        """
+        elapsed = (time() - self.start_time) if self.start_time else 0
+        return {
+            "size": self.size,
+            "launch_count": self.launch_count,
+            "acquire_count": self.acquire_count,
+            "peak_in_use": self.peak_in_use,
+            "utilization": (self.busy_time / (elapsed * self.size)) if elapsed else 0,
+        }
+
+    def close(self):
+        """
+        Quit all the idle drivers and print the stats
+        """
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for driver in idle:
+            self.quit(driver)
+        if self.acquire_count:
+            stats = self.get_stats()
+            print(
+                f"Driver pool: {stats['launch_count']} launches for {stats['acquire_count']} uses, "
+                f"peak {stats['peak_in_use']}/{stats['size']} in use, utilization {stats['utilization']:.0%}"
+            )
+        self.launch_count = self.acquire_count = self.peak_in_use = 0
+        self.busy_time = 0
+        self.start_time = None
+
+
+driver_pool = DriverPool()
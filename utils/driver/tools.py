@@ -4,6 +4,7 @@ from time import sleep
 from bs4 import BeautifulSoup
 
 from utils.config import config
+from utils.requests.rate_limit import rate_limiter
 from utils.retry import (
     retry_func,
     locate_element_with_retry,
@@ -17,24 +18,34 @@ if config.open_driver:
         pass
 
 
+def get_driver_page(driver, url):
+    """
+    Get the page by driver under the rate limit of the host
+    """
+    rate_limiter.acquire(url)
+    driver.get(url)
+    rate_limiter.report(url, content=driver.page_source)
+
+
 def get_soup_driver(url):
     """
     Get the soup by driver
     """
-    from utils.driver.setup import setup_driver
-
-    driver = setup_driver()
-    retry_func(lambda: driver.get(url), name=url)
-    sleep(1)
-    source = re.sub(
-        r"<!--.*?-->",
-        "",
-        driver.page_source,
-        flags=re.DOTALL,
-    )
+    from utils.driver.pool import driver_pool
+
+    driver = driver_pool.acquire()
+    try:
+        retry_func(lambda: get_driver_page(driver, url), name=url)
+        sleep(1)
+        source = re.sub(
+            r"<!--.*?-->",
+            "",
+            driver.page_source,
+            flags=re.DOTALL,
+        )
+    finally:
+        driver_pool.release(driver)
     soup = BeautifulSoup(source, "html.parser")
-    driver.close()
-    driver.quit()
     return soup
 
 
@@ -0,0 +1,206 @@
+import asyncio
+import os
+import threading
+from time import time
+
+import utils.constants as constants
+from utils.tools import resource_path
+
+
+def format_labels(label_names, label_values, extra=None):
+    """
+    Format the labels of the sample in the Prometheus text format
+    """
+    items = list(zip(label_names, label_values))
+    if extra:
+        items.append(extra)
+    if not items:
+        return ""
+    labels = ",".join(
+        f'{name}="{str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")}"'
+        for name, value in items
+    )
+    return f"{{{labels}}}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base of the metrics, the samples are keyed by the label values
+    """
+    type = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def get_key(self, labels):
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def render_samples(self):
+        with self.lock:
+            return [
+                f"{self.name}{format_labels(self.label_names, key)} {format_value(value)}"
+                for key, value in self.values.items()
+            ]
+
+    def render(self):
+        samples = self.render_samples()
+        if not samples:
+            return ""
+        return "\n".join([f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}", *samples])
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.get_key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=constants.metrics_seconds_buckets):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            counts, total = self.values.get(key) or ([0] * len(self.buckets), 0)
+            for i, bucket in enumerate(self.buckets):
+                if value <= bucket:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    def render_samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total) in self.values.items():
+                for bucket, count in zip(self.buckets, counts):
+                    samples.append(
+                        f"{self.name}_bucket{format_labels(self.label_names, key, ('le', format_value(bucket)))} {count}"
+                    )
+                samples.append(f"{self.name}_sum{format_labels(self.label_names, key)} {format_value(total)}")
+                samples.append(f"{self.name}_count{format_labels(self.label_names, key)} {counts[-1]}")
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Registry of the metrics, rendered in the Prometheus text format
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, label_names=()) -> Counter:
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=()) -> Gauge:
+        return self.register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=constants.metrics_seconds_buckets) -> Histogram:
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self):
+        """
+        Render the metrics having samples
+        """
+        return "".join(f"{text}\n" for metric in self.metrics.values() if (text := metric.render()))
+
+    def write(self, path=constants.metrics_path):
+        """
+        Write the metrics to the textfile, replace the old file atomically
+        """
+        try:
+            path = resource_path(path, persistent=True)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                file.write(self.render())
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Write metrics failed: {e}")
+
+
+metrics = MetricsRegistry()
+
+source_fetch_seconds = metrics.histogram(
+    "iptv_source_fetch_seconds", "Duration of fetching the source", ("source",),
+    buckets=constants.metrics_long_seconds_buckets)
+source_result_urls = metrics.gauge(
+    "iptv_source_result_urls", "Number of urls got from the source in the last run", ("source",))
+speed_test_total = metrics.counter(
+    "iptv_speed_test_total", "Number of urls tested by the speed test", ("result",))
+speed_test_delay_seconds = metrics.histogram(
+    "iptv_speed_test_delay_seconds", "Delay of the tested urls")
+speed_test_speed_mbps = metrics.histogram(
+    "iptv_speed_test_speed_mbps", "Download speed of the tested urls in MB/s",
+    buckets=constants.metrics_speed_buckets)
+sort_urls_total = metrics.counter(
+    "iptv_sort_urls_total", "Number of urls passed or filtered by the sort", ("result",))
+cache_requests_total = metrics.counter(
+    "iptv_cache_requests_total", "Number of cache lookups", ("cache", "result"))
+event_loop_lag_seconds = metrics.histogram(
+    "iptv_event_loop_lag_seconds", "Lag of the event loop scheduling",
+    buckets=constants.metrics_lag_buckets)
+update_duration_seconds = metrics.gauge(
+    "iptv_update_duration_seconds", "Duration of the update stage in the last run", ("stage",))
+update_last_success_timestamp = metrics.gauge(
+    "iptv_update_last_success_timestamp_seconds", "Timestamp of the last successful update")
+http_requests_total = metrics.counter(
+    "iptv_http_requests_total", "Number of the service requests", ("endpoint", "status"))
+http_request_seconds = metrics.histogram(
+    "iptv_http_request_seconds", "Duration of the service requests", ("endpoint",))
+
+
+async def monitor_event_loop_lag(interval=constants.event_loop_lag_interval):
+    """
+    Measure the lag of the event loop by the delay of a periodic sleep until cancelled
+    """
+    while True:
+        start = time()
+        await asyncio.sleep(interval)
+        event_loop_lag_seconds.observe(max(time() - start - interval, 0))
+
+
+def get_metrics_text():
+    """
+    Get the metrics of the current process with the metrics of the last update run from the textfile,
+    the metrics of the current process win on the same name
+    """
+    text = metrics.render()
+    names = {name for name, metric in metrics.metrics.items() if metric.values}
+    try:
+        with open(resource_path(constants.metrics_path), "r", encoding="utf-8") as file:
+            blocks = file.read().split("# HELP ")
+    except FileNotFoundError:
+        return text
+    for block in blocks:
+        if block and block.split(" ", 1)[0] not in names:
+            text += f"# HELP {block}"
+    return text
@@ -0,0 +1,121 @@
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import utils.constants as constants
+
+
+class HttpClient:
+    """
+    Thread-safe HTTP client, every thread keeps its own keep-alive session and the concurrent connections are bounded per host
+    """
+
+    def __init__(self, pool_connections=constants.request_pool_connections,
+                 host_max_connections=constants.request_host_max_connections):
+        self.pool_connections = pool_connections
+        self.host_max_connections = host_max_connections
+        self.local = threading.local()
+        self.sessions = []
+        self.host_semaphores = {}
+        self.lock = threading.Lock()
+        self.generation = 0
+
+    def get_session(self) -> requests.Session:
+        """
+        Get the session of the current thread
+        """
+        session = getattr(self.local, "session", None)
+        if session is None or self.local.generation != self.generation:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.host_max_connections)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            with self.lock:
+                self.sessions.append(session)
+                self.local.generation = self.generation
+            self.local.session = session
+        return session
+
+    def release_session(self):
+        """
+        Close and drop the session of the current thread, used by the short-lived threads before they exit
+        """
+        session = getattr(self.local, "session", None)
+        if session is None:
+            return
+        self.local.session = None
+        with self.lock:
+            if session in self.sessions:
+                self.sessions.remove(session)
+        session.close()
+
+    def get_host_semaphore(self, url) -> threading.BoundedSemaphore:
+        """
+        Get the semaphore bounding the concurrent connections of the host
+        """
+        host = urlparse(url).netloc
+        with self.lock:
+            semaphore = self.host_semaphores.get(host)
+            if semaphore is None:
+                limit = constants.request_host_connections.get(host, self.host_max_connections)
+                semaphore = self.host_semaphores[host] = threading.BoundedSemaphore(limit)
+        return semaphore
+
+    def request(self, method, url, proxy=None, **kwargs) -> requests.Response:
+        """
+        Send the request with the session of the current thread, the proxy is used for both http and https
+        """
+        if proxy:
+            kwargs["proxies"] = {"http": proxy, "https": proxy}
+        with self.get_host_semaphore(url):
+            return self.get_session().request(method, url, **kwargs)
+
+    def get(self, url, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, data=None, **kwargs) -> requests.Response:
+        return self.request("POST", url, data=data, **kwargs)
+
+    def get_stats(self):
+        """
+        Get the connection reuse stats of the alive connection pools
+        """
+        connections = 0
+        requests_num = 0
+        with self.lock:
+            adapters = {adapter for session in self.sessions for adapter in session.adapters.values()}
+        for adapter in adapters:
+            managers = [adapter.poolmanager, *adapter.proxy_manager.values()]
+            for manager in managers:
+                for key in manager.pools.keys():
+                    pool = manager.pools.get(key)
+                    if pool:
+                        connections += pool.num_connections
+                        requests_num += pool.num_requests
+        return {
+            "sessions": len(self.sessions),
+            "requests": requests_num,
+            "connections": connections,
+            "reuse": (1 - connections / requests_num) if requests_num else 0,
+        }
+
+    def close(self):
+        """
+        Close all the sessions and print the stats, the threads will get new sessions after closed
+        """
+        stats = self.get_stats()
+        if stats["requests"]:
+            print(
+                f"HTTP client: {stats['requests']} requests over {stats['connections']} connections "
+                f"in {stats['sessions']} sessions, reuse {stats['reuse']:.0%}"
+            )
+        with self.lock:
+            sessions, self.sessions = self.sessions, []
+            self.generation += 1
+        for session in sessions:
+            session.close()
+
+
+http_client = HttpClient()
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import pickle
+import threading
+from time import time, sleep
+from urllib.parse import urlparse
+
+import utils.constants as constants
+from utils.config import config
+from utils.tools import resource_path
+
+
+class RateLimitError(Exception):
+    """
+    The upstream host is cooling down after a ban
+    """
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter keyed by upstream host, back off automatically when the host bans the requests
+    """
+
+    def __init__(self, rates=None, path=constants.rate_limit_path):
+        self.rates = config.request_rate_limit if rates is None else rates
+        self.path = path
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.state = self.load()
+
+    def load(self):
+        """
+        Load the cooldown state of the hosts
+        """
+        try:
+            with open(resource_path(self.path), "rb") as file:
+                return pickle.load(file) or {}
+        except:
+            return {}
+
+    def save(self):
+        """
+        Save the cooldown state of the hosts, pickle a copy taken under the lock
+        """
+        with self.lock:
+            state = {host: dict(host_state) for host, host_state in self.state.items()}
+        try:
+            path = resource_path(self.path, persistent=True)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                pickle.dump(state, file)
+        except Exception as e:
+            print(f"Save rate limit state failed: {e}")
+
+    @staticmethod
+    def get_host(url):
+        """
+        Get the host of the url
+        """
+        return urlparse(url).netloc if url and "://" in url else url
+
+    def get_rate(self, host):
+        """
+        Get the rate (requests per second) of the host, 0 means no limit
+        """
+        if host in self.rates:
+            return self.rates[host]
+        for rate_host, rate in self.rates.items():
+            if rate_host != "*" and host.endswith(f".{rate_host}"):
+                return rate
+        return self.rates.get("*", 0)
+
+    def get_cooldown(self, url):
+        """
+        Get the remaining cooldown seconds of the host
+        """
+        host_state = self.state.get(self.get_host(url))
+        return max(host_state["cooldown_until"] - time(), 0) if host_state else 0
+
+    def reserve(self, url, max_wait=None):
+        """
+        Reserve a request of the host, return the seconds to wait before the request
+        """
+        host = self.get_host(url)
+        if not host:
+            return 0
+        cooldown = self.get_cooldown(host)
+        max_wait = config.request_timeout if max_wait is None else max_wait
+        if cooldown > max_wait:
+            raise RateLimitError(f"{host} is cooling down, {int(cooldown)}s remaining")
+        rate = self.get_rate(host)
+        if rate <= 0:
+            return cooldown
+        with self.lock:
+            now = time()
+            next_time = max(self.buckets.get(host, now), now + cooldown)
+            self.buckets[host] = next_time + 1 / rate
+        return next_time - now
+
+    def acquire(self, url, max_wait=None):
+        """
+        Wait until the request of the host is allowed
+        """
+        wait = self.reserve(url, max_wait)
+        if wait > 0:
+            sleep(wait)
+
+    async def acquire_async(self, url, max_wait=None):
+        """
+        Wait until the request of the host is allowed, without blocking the event loop
+        """
+        wait = self.reserve(url, max_wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def check_banned(self, status=None, content=None) -> bool:
+        """
+        Check if the response is banned by the status or the ban keywords
+        """
+        if status in constants.ban_status_codes:
+            return True
+        return bool(content) and any(keyword in content for keyword in constants.ban_keywords)
+
+    def report(self, url, status=None, content=None) -> bool:
+        """
+        Report the response of the host, start the cooldown if banned, return True if banned
+        """
+        host = self.get_host(url)
+        if not host:
+            return False
+        banned = self.check_banned(status, content)
+        with self.lock:
+            host_state = self.state.get(host)
+            if not banned:
+                if host_state and host_state["bans"]:
+                    host_state["bans"] = 0
+                return False
+            bans = (host_state["bans"] if host_state else 0) + 1
+            cooldown = min(constants.ban_cooldown * (2 ** (bans - 1)), constants.ban_max_cooldown)
+            self.state[host] = {"bans": bans, "cooldown_until": time() + cooldown}
+        print(f"{host} banned the requests, cooling down for {int(cooldown)}s")
+        self.save()
+        return True
+
+
+rate_limiter = RateLimiter()
@@ -1,8 +1,12 @@
 import re
+from time import time
 
-import requests
 from bs4 import BeautifulSoup
 
+import utils.constants as constants
+from utils.requests.client import http_client
+from utils.requests.rate_limit import rate_limiter
+
 headers = {
     "Accept": "*/*",
     "Connection": "keep-alive",
@@ -10,20 +14,27 @@ headers = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
 }
 
-session = requests.Session()
-
 
 def get_source_requests(url, data=None, proxy=None, timeout=30):
     """
     Get the source by requests
     """
-    proxies = {"http": proxy}
-    if data:
-        response = session.post(
-            url, headers=headers, data=data, proxies=proxies, timeout=timeout
-        )
-    else:
-        response = session.get(url, headers=headers, proxies=proxies, timeout=timeout)
+    rate_limiter.acquire(url)
+    start_time = time()
+    try:
+        if data:
+            response = http_client.post(url, data=data, headers=headers, proxy=proxy, timeout=timeout)
+        else:
+            response = http_client.get(url, headers=headers, proxy=proxy, timeout=timeout)
+    except Exception:
+        if proxy:
+            report_proxy(proxy, url)
+        raise
+    if proxy:
+        report_proxy(proxy, url, int(round((time() - start_time) * 1000)) if response.ok else None)
+    rate_limiter.report(url, response.status_code, response.text)
+    if response.status_code in constants.retry_status_codes:
+        response.raise_for_status()
     source = re.sub(
         r"<!--.*?-->",
         "",
@@ -42,8 +53,11 @@ def get_soup_requests(url, data=None, proxy=None, timeout=30):
     return soup
 
 
-def close_session():
+def report_proxy(proxy, url, latency=None):
     """
-    Close the requests session
+    Report the result of the proxy request to the proxy pool
     """
-    session.close()
+    from updates.proxy.pool import proxy_pool
+
+    proxy_pool.record(proxy, url, latency)
+
@@ -1,4 +1,14 @@
+import asyncio
+import random
+import threading
+from collections import defaultdict
 from time import sleep
+from urllib.parse import urlparse
+
+import aiohttp
+import requests
+
+import utils.constants as constants
 from utils.config import config
 
 if config.open_driver:
@@ -12,22 +22,149 @@ if config.open_driver:
 max_retries = 2
 
 
-def retry_func(func, retries=max_retries, name=""):
+class RetryPolicy:
+    """
+    Retry policy with exponential backoff and jitter, only retry the retryable errors within the host retry budget
+    """
+
+    def __init__(self, retries=max_retries, base_delay=constants.retry_base_delay,
+                 max_delay=constants.retry_max_delay, host_budget=constants.retry_host_budget):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.host_budget = host_budget
+        self.host_retries = defaultdict(int)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        """
+        Check if the error is retryable: connection errors, timeouts and retryable HTTP status
+        """
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None) or getattr(error, "status", None)
+        if isinstance(status, int):
+            return status in constants.retry_status_codes
+        if isinstance(error, requests.exceptions.RequestException):
+            return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                                      requests.exceptions.ChunkedEncodingError))
+        if isinstance(error, aiohttp.ClientError):
+            return isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError))
+        if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+            return True
+        return (type(error).__module__ or "").startswith("selenium")
+
+    @staticmethod
+    def is_retryable_result(result) -> bool:
+        """
+        Check if the result is a response with retryable HTTP status
+        """
+        status = getattr(result, "status_code", None) or getattr(result, "status", None)
+        return isinstance(status, int) and status in constants.retry_status_codes
+
+    @staticmethod
+    def get_host(url):
+        """
+        Get the host of the url for the retry budget
+        """
+        if not url or "://" not in url:
+            return None
+        return urlparse(url).netloc or None
+
+    def consume_budget(self, host) -> bool:
+        """
+        Consume one retry of the host budget, return False if the budget is exhausted
+        """
+        host = self.get_host(host)
+        if not host or not self.host_budget:
+            return True
+        with self.lock:
+            if self.host_retries[host] >= self.host_budget:
+                return False
+            self.host_retries[host] += 1
+            return True
+
+    def reset(self):
+        """
+        Reset the host retry budgets for a new run
+        """
+        with self.lock:
+            self.host_retries.clear()
+
+    def get_delay(self, attempt) -> float:
+        """
+        Get the backoff delay of the attempt with full jitter
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def should_retry(self, attempt, retries, host, name, error=None) -> bool:
+        """
+        Check if the attempt should be retried
+        """
+        if attempt >= retries - 1 or (error is not None and not self.is_retryable(error)):
+            return False
+        if not self.consume_budget(host):
+            if name:
+                print(f"Retry budget of {self.get_host(host)} exhausted, skip retrying {name}")
+            return False
+        if name:
+            print(f"Failed to connect to the {name}. Retrying {attempt + 1}...")
+        return True
+
+    def call(self, func, name="", host=None, retries=None):
+        """
+        Call the function with retry
+        """
+        retries = retries or self.retries
+        for attempt in range(retries):
+            try:
+                result = func()
+            except Exception as e:
+                if not self.should_retry(attempt, retries, host, name, e):
+                    raise Exception(
+                        f"Failed to connect to the {name} reached the maximum retries."
+                    ) from e
+            else:
+                if not self.is_retryable_result(result) or not self.should_retry(attempt, retries, host, name):
+                    return result
+            sleep(self.get_delay(attempt))
+        raise Exception(f"Failed to connect to the {name} reached the maximum retries.")
+
+    async def call_async(self, func, name="", host=None, retries=None):
+        """
+        Call the coroutine function with retry
+        """
+        retries = retries or self.retries
+        for attempt in range(retries):
+            try:
+                result = await func()
+            except Exception as e:
+                if not self.should_retry(attempt, retries, host, name, e):
+                    raise Exception(
+                        f"Failed to connect to the {name} reached the maximum retries."
+                    ) from e
+            else:
+                if not self.is_retryable_result(result) or not self.should_retry(attempt, retries, host, name):
+                    return result
+            await asyncio.sleep(self.get_delay(attempt))
+        raise Exception(f"Failed to connect to the {name} reached the maximum retries.")
+
+
+retry_policy = RetryPolicy()
+
+
+def retry_func(func, retries=max_retries, name="", host=None):
     """
     Retry the function
     """
-    for i in range(retries):
-        try:
-            sleep(1)
-            return func()
-        except Exception as e:
-            if name and i < retries - 1:
-                print(f"Failed to connect to the {name}. Retrying {i+1}...")
-            elif i == retries - 1:
-                raise Exception(
-                    f"Failed to connect to the {name} reached the maximum retries."
-                )
-    raise Exception(f"Failed to connect to the {name} reached the maximum retries.")
+    return retry_policy.call(func, name=name, host=host or name, retries=retries)
+
+
+async def retry_async_func(func, retries=max_retries, name="", host=None):
+    """
+    Retry the coroutine function
+    """
+    return await retry_policy.call_async(func, name=name, host=host or name, retries=retries)
 
 
 def locate_element_with_retry(
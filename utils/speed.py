@@ -1,28 +1,169 @@
 import asyncio
 import http.cookies
 import json
+import math
+import os
+import pickle
 import re
 import subprocess
 from time import time
 from urllib.parse import quote, urlparse
 
 import m3u8
-from aiohttp import ClientSession, TCPConnector
+from aiohttp import ClientConnectionError, ClientSession, ClientTimeout, TCPConnector
 from multidict import CIMultiDictProxy
 
 import utils.constants as constants
+from utils.cache import get_cache_key
 from utils.config import config
-from utils.tools import remove_cache_info, get_resolution_value
-from utils.types import TestResult, ChannelTestResult, TestResultCacheData
+from utils.metrics import (
+    cache_requests_total,
+    speed_test_total,
+    speed_test_delay_seconds,
+    speed_test_speed_mbps,
+    sort_urls_total,
+)
+from utils.tools import remove_cache_info, get_resolution_value, resource_path
+from utils.types import TestResult, ChannelTestResult, TestResultCacheData, SpeedResultData, HostLatencyData
 
 http.cookies._is_legal_key = lambda _: True
 cache: TestResultCacheData = {}
 
 
-async def get_speed_with_download(url: str, session: ClientSession = None, timeout: int = config.sort_timeout) -> dict[
-    str, float | None]:
+class HostUnreachableError(Exception):
+    """
+    The tested host has no response: the connection failed or timed out
     """
-    Get the speed of the url with a total timeout
+
+
+class HostCircuitBreaker:
+    """
+    Circuit breaker of the tested hosts (host:port), open after the consecutive connect failures or timeouts and keep
+    open for the rest of the run
+    """
+
+    def __init__(self, fail_limit=None):
+        self.fail_limit = config.sort_host_fail_limit if fail_limit is None else fail_limit
+        self.fails = {}
+        self.skips = {}
+        self.opened = set()
+
+    def is_open(self, host) -> bool:
+        """
+        Check if the breaker of the host is open, count the skipped test
+        """
+        if host in self.opened:
+            self.skips[host] = self.skips.get(host, 0) + 1
+            return True
+        return False
+
+    def record(self, host, success):
+        """
+        Record the test result of the host, open the breaker when reaching the fail limit
+        """
+        if not host or self.fail_limit <= 0:
+            return
+        if success:
+            self.fails[host] = 0
+            return
+        self.fails[host] = self.fails.get(host, 0) + 1
+        if self.fails[host] >= self.fail_limit:
+            self.opened.add(host)
+
+    def log_state(self, logger):
+        """
+        Log the breaker state of the hosts with failures
+        """
+        for host, fails in self.fails.items():
+            if fails or host in self.opened:
+                logger.info(
+                    f"Host: {host}, Breaker: {'open' if host in self.opened else 'closed'}, "
+                    f"Consecutive fails: {fails}, Skipped: {self.skips.get(host, 0)}"
+                )
+        if self.opened:
+            print(f"Circuit breaker: {len(self.opened)} hosts opened, "
+                  f"{sum(self.skips.values())} tests skipped")
+
+    def reset(self):
+        """
+        Reset the breaker state for a new run
+        """
+        self.fail_limit = config.sort_host_fail_limit
+        self.fails.clear()
+        self.skips.clear()
+        self.opened.clear()
+
+
+host_breaker = HostCircuitBreaker()
+
+
+class HostLatencyHistory:
+    """
+    Latency history of the tested hosts, derive the connect and first byte timeout of the host from the p95 latency
+    """
+
+    def __init__(self, path=constants.host_latency_path):
+        self.path = path
+        self.history: HostLatencyData = {}
+
+    def load(self):
+        """
+        Load the latency history of the previous runs
+        """
+        try:
+            with open(resource_path(self.path), "rb") as file:
+                history = pickle.load(file) or {}
+            self.history = {host: item for host, item in history.items() if isinstance(item, dict)}
+        except:
+            self.history = {}
+
+    def save(self):
+        """
+        Save the latency history, remove the hosts not recorded within the host cache TTL
+        """
+        ttl = config.host_cache_ttl * 86400
+        if ttl > 0:
+            now = time()
+            self.history = {host: item for host, item in self.history.items() if now - item["time"] <= ttl}
+        try:
+            with open(resource_path(self.path, persistent=True), "wb") as file:
+                pickle.dump(self.history, file)
+        except Exception as e:
+            print(f"Save host latency history failed: {e}")
+
+    def record(self, host, delay):
+        """
+        Record the latency (ms) of the host, keep the latest samples
+        """
+        if not host or delay is None or delay < 0:
+            return
+        item = self.history.setdefault(host, {"time": 0, "samples": []})
+        item["time"] = time()
+        item["samples"].append(delay)
+        del item["samples"][:-constants.host_latency_history_size]
+
+    def get_timeout(self, host, timeout=config.sort_timeout) -> ClientTimeout | None:
+        """
+        Get the timeout of the host: the p95 latency multiplied by the factor as the connect and first byte timeout,
+        clamped between the min timeout and the sort timeout
+        """
+        samples = self.history.get(host, {}).get("samples")
+        if not samples or len(samples) < constants.host_latency_min_samples:
+            return None
+        samples = sorted(samples)
+        p95 = samples[min(int(len(samples) * 0.95), len(samples) - 1)]
+        host_timeout = min(max(p95 / 1000 * constants.adaptive_timeout_factor, constants.adaptive_timeout_min), timeout)
+        return ClientTimeout(total=timeout, sock_connect=host_timeout, sock_read=host_timeout)
+
+
+host_latency = HostLatencyHistory()
+
+
+async def get_speed_with_download(url: str, session: ClientSession = None, timeout: int = config.sort_timeout,
+                                  client_timeout: ClientTimeout = None) -> dict[str, float | None]:
+    """
+    Get the speed of the url with a total timeout, the client timeout of the host limits the connect and the response
+    headers, the body is read within the total timeout
     """
     start_time = time()
     total_size = 0
@@ -33,29 +174,35 @@ async def get_speed_with_download(url: str, session: ClientSession = None, timeo
         created_session = True
     else:
         created_session = False
+    request_timeout = ClientTimeout(total=timeout, sock_connect=client_timeout.sock_connect) if client_timeout \
+        else timeout
     try:
-        async with session.get(url, timeout=timeout) as response:
+        response = await asyncio.wait_for(session.get(url, timeout=request_timeout),
+                                          client_timeout.sock_read if client_timeout else None)
+        async with response:
             if response.status != 200:
                 raise Exception("Invalid response")
             info['delay'] = int(round((time() - start_time) * 1000))
             async for chunk in response.content.iter_any():
                 if chunk:
                     total_size += len(chunk)
+    except asyncio.CancelledError:
+        raise
     except:
         pass
     finally:
-        if total_size > 0:
-            total_time += time() - start_time
-            info['speed'] = ((total_size / total_time) if total_time > 0 else 0) / 1024 / 1024
         if created_session:
             await session.close()
-        return info
+    if total_size > 0:
+        total_time += time() - start_time
+        info['speed'] = ((total_size / total_time) if total_time > 0 else 0) / 1024 / 1024
+    return info
 
 
-async def get_m3u8_headers(url: str, session: ClientSession = None, timeout: int = 5) -> CIMultiDictProxy[str] | dict[
-    any, any]:
+async def get_m3u8_headers(url: str, session: ClientSession = None, timeout: int | ClientTimeout = 5,
+                           raise_unreachable: bool = False) -> CIMultiDictProxy[str] | dict[any, any]:
     """
-    Get the headers of the m3u8 url
+    Get the headers of the m3u8 url, raise HostUnreachableError on the connect failure or timeout if raise_unreachable
     """
     if session is None:
         session = ClientSession(connector=TCPConnector(ssl=False), trust_env=True)
@@ -66,12 +213,17 @@ async def get_m3u8_headers(url: str, session: ClientSession = None, timeout: int
     try:
         async with session.head(url, timeout=timeout) as response:
             headers = response.headers
+    except asyncio.CancelledError:
+        raise
+    except (ClientConnectionError, asyncio.TimeoutError) as e:
+        if raise_unreachable:
+            raise HostUnreachableError(url) from e
     except:
         pass
     finally:
         if created_session:
             await session.close()
-        return headers
+    return headers
 
 
 def check_m3u8_valid(headers: CIMultiDictProxy[str] | dict[any, any]) -> bool:
@@ -85,19 +237,26 @@ def check_m3u8_valid(headers: CIMultiDictProxy[str] | dict[any, any]) -> bool:
 
 
 async def get_speed_m3u8(url: str, resolution: str = None, filter_resolution: bool = config.open_filter_resolution,
-                         timeout: int = config.sort_timeout) -> dict[str, float | None]:
+                         timeout: int = config.sort_timeout, client_timeout: ClientTimeout = None) -> dict[
+    str, float | None]:
     """
-    Get the speed of the m3u8 url with a total timeout
+    Get the speed of the m3u8 url with a total timeout, the client timeout of the host limits the connect and first byte,
+    raise HostUnreachableError if the host of the url has no response
     """
     info = {'speed': None, 'delay': None, 'resolution': resolution}
     location = None
+    headers_timeout = ClientTimeout(total=5, sock_connect=client_timeout.sock_connect,
+                                    sock_read=client_timeout.sock_read) if client_timeout else 5
     try:
         url = quote(url, safe=':/?$&=@[]%').partition('$')[0]
         async with ClientSession(connector=TCPConnector(ssl=False), trust_env=True) as session:
-            headers = await get_m3u8_headers(url, session)
+            headers = await get_m3u8_headers(url, session, headers_timeout, raise_unreachable=True)
             location = headers.get('Location')
             if location:
-                info.update(await get_speed_m3u8(location, resolution, filter_resolution, timeout))
+                try:
+                    info.update(await get_speed_m3u8(location, resolution, filter_resolution, timeout, client_timeout))
+                except HostUnreachableError:
+                    pass
             elif check_m3u8_valid(headers):
                 m3u8_obj = m3u8.load(url, timeout=2)
                 playlists = m3u8_obj.data.get('playlists')
@@ -105,10 +264,10 @@ async def get_speed_m3u8(url: str, resolution: str = None, filter_resolution: bo
                 if not segments and playlists:
                     parsed_url = urlparse(url)
                     uri = f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path.rsplit('/', 1)[0]}/{playlists[0].get('uri', '')}"
-                    uri_headers = await get_m3u8_headers(uri, session)
+                    uri_headers = await get_m3u8_headers(uri, session, headers_timeout)
                     if not check_m3u8_valid(uri_headers):
                         if uri_headers.get('Content-Length'):
-                            info.update(await get_speed_with_download(uri, session, timeout))
+                            info.update(await get_speed_with_download(uri, session, timeout, client_timeout))
                         raise Exception("Invalid m3u8")
                     m3u8_obj = m3u8.load(uri, timeout=2)
                     segments = m3u8_obj.segments
@@ -120,19 +279,20 @@ async def get_speed_m3u8(url: str, resolution: str = None, filter_resolution: bo
                 for ts_url in ts_urls:
                     if time() - start_time > timeout:
                         break
-                    download_info = await get_speed_with_download(ts_url, session, timeout)
+                    download_info = await get_speed_with_download(ts_url, session, timeout, client_timeout)
                     speed_list.append(download_info['speed'])
                     if info['delay'] is None and download_info['delay'] is not None:
                         info['delay'] = download_info['delay']
                 info['speed'] = (sum(speed_list) / len(speed_list)) if speed_list else 0
             elif headers.get('Content-Length'):
-                info.update(await get_speed_with_download(url, session, timeout))
+                info.update(await get_speed_with_download(url, session, timeout, client_timeout))
+    except (asyncio.CancelledError, HostUnreachableError):
+        raise
     except:
         pass
-    finally:
-        if not resolution and filter_resolution and not location and info['delay'] is not None:
-            info['resolution'] = await get_resolution_ffprobe(url, timeout)
-        return info
+    if not resolution and filter_resolution and not location and info['delay'] is not None:
+        info['resolution'] = await get_resolution_ffprobe(url, timeout)
+    return info
 
 
 async def get_delay_requests(url, timeout=config.sort_timeout, proxy=None):
@@ -227,13 +387,15 @@ async def get_resolution_ffprobe(url: str, timeout: int = config.sort_timeout) -
         out, _ = await asyncio.wait_for(proc.communicate(), timeout)
         video_stream = json.loads(out.decode('utf-8'))["streams"][0]
         resolution = f"{video_stream['width']}x{video_stream['height']}"
-    except:
-        if proc:
+    except BaseException as e:
+        if proc and proc.returncode is None:
             proc.kill()
+        if not isinstance(e, Exception):
+            raise
     finally:
         if proc:
             await proc.wait()
-        return resolution
+    return resolution
 
 
 def get_video_info(video_info):
@@ -288,6 +450,7 @@ async def get_speed(url, is_ipv6=False, ipv6_proxy=None, resolution=None,
             if matcher:
                 cache_key = matcher.group(1)
         if cache_key in cache:
+            cache_requests_total.inc(cache="speed", result="hit")
             cache_list = cache[cache_key]
             for cache_item in cache_list:
                 if cache_item['speed'] > 0 and cache_item['delay'] != -1 and get_resolution_value(
@@ -299,20 +462,207 @@ async def get_speed(url, is_ipv6=False, ipv6_proxy=None, resolution=None,
                 data['speed'] = float("inf")
                 data['delay'] = 0
                 data['resolution'] = "1920x1080"
+            elif host_breaker.is_open(host := urlparse(url).netloc):
+                data['speed'] = 0
+                data['delay'] = -1
+                speed_test_total.inc(result="circuit_open")
+                return data
             elif constants.rtmp_url_pattern.match(url) is not None:
                 start_time = time()
                 if not data['resolution'] and filter_resolution:
                     data['resolution'] = await get_resolution_ffprobe(url, timeout)
                 data['delay'] = int(round((time() - start_time) * 1000))
                 data['speed'] = float("inf") if data['resolution'] is not None else 0
+                observe_speed_test(data)
             else:
-                data.update(await get_speed_m3u8(url, resolution, filter_resolution, timeout))
+                try:
+                    data.update(await get_speed_m3u8(url, resolution, filter_resolution, timeout,
+                                                     host_latency.get_timeout(host, timeout)))
+                    host_breaker.record(host, True)
+                except HostUnreachableError:
+                    host_breaker.record(host, False)
+                host_latency.record(host, data['delay'])
+                observe_speed_test(data)
             if cache_key:
+                cache_requests_total.inc(cache="speed", result="miss")
                 cache.setdefault(cache_key, []).append(data)
+    except asyncio.CancelledError:
+        raise
+    except:
+        pass
     finally:
         if callback:
             callback()
-        return data
+    return data
+
+
+def observe_speed_test(data: TestResult):
+    """
+    Observe the result of the speed test in the metrics
+    """
+    if data['delay'] is None or data['delay'] < 0:
+        speed_test_total.inc(result="no_response")
+        return
+    speed_test_delay_seconds.observe(data['delay'] / 1000)
+    if not data['speed']:
+        speed_test_total.inc(result="no_speed")
+        return
+    speed_test_total.inc(result="success")
+    if math.isfinite(data['speed']):
+        speed_test_speed_mbps.observe(data['speed'])
+
+
+def get_speed_result_store() -> SpeedResultData:
+    """
+    Get the stored speed results of the previous runs
+    """
+    try:
+        with open(resource_path(constants.speed_result_path), "rb") as file:
+            return pickle.load(file) or {}
+    except:
+        return {}
+
+
+def check_speed_result_fresh(item, now=None, ttl=None) -> bool:
+    """
+    Check if the stored speed result is passed and within the TTL
+    """
+    now = now or time()
+    ttl = config.incremental_ttl * 3600 if ttl is None else ttl
+    return now - item["time"] <= ttl and any(
+        result["speed"] and result["delay"] is not None and result["delay"] != -1 for result in item["results"]
+    )
+
+
+def load_speed_result_cache(keys, fresh=True) -> set[str]:
+    """
+    Load the stored results of the keys into the speed cache, only the fresh ones if fresh, return the loaded keys
+    """
+    store = get_speed_result_store()
+    now = time()
+    loaded_keys = set()
+    for key in keys:
+        item = store.get(key)
+        if key not in cache and item and (not fresh or check_speed_result_fresh(item, now)):
+            cache[key] = list(item["results"])
+            loaded_keys.add(key)
+    if fresh:
+        cache_requests_total.inc(len(loaded_keys), cache="incremental", result="hit")
+        cache_requests_total.inc(len(keys) - len(loaded_keys), cache="incremental", result="miss")
+    return loaded_keys
+
+
+def update_speed_result_store(skip_keys: set[str] = None):
+    """
+    Update the stored speed results with the results tested in this run, remove the results older than the host cache TTL
+    """
+    store = get_speed_result_store()
+    now = time()
+    for key, results in cache.items():
+        if results and (not skip_keys or key not in skip_keys):
+            store[key] = {"time": now, "results": results}
+    ttl = config.host_cache_ttl * 86400
+    if ttl > 0:
+        store = {key: item for key, item in store.items() if now - item["time"] <= ttl}
+    with open(resource_path(constants.speed_result_path, persistent=True), "wb") as file:
+        pickle.dump(store, file)
+
+
+def get_expected_value(info, store: SpeedResultData, origin_priority: list[str]) -> tuple[float, int]:
+    """
+    Get the expected value of the url info by the stored speed result and the origin priority
+    """
+    item = store.get(get_cache_key(info)) if store else None
+    results = item["results"] if item else []
+    passed_speeds = [
+        result["speed"] for result in results
+        if result["speed"] and result["delay"] is not None and result["delay"] != -1
+    ]
+    if passed_speeds:
+        score = sum(passed_speeds) / len(passed_speeds)
+    else:
+        score = -1 if results else 0
+    origin = info.get("origin")
+    origin_rank = len(origin_priority) - origin_priority.index(origin) if origin in origin_priority else 0
+    return score, origin_rank
+
+
+def get_sort_priority_list(data, store: SpeedResultData = None) -> list:
+    """
+    Get the url info list ordered by priority: the rank by the expected value in the channel, then the template order
+    """
+    store = get_speed_result_store() if store is None else store
+    origin_priority = config.origin_type_prefer + [
+        origin for origin in constants.sort_origin_priority if origin not in config.origin_type_prefer
+    ]
+    items = []
+    channel_index = 0
+    for channel_obj in data.values():
+        for info_list in channel_obj.values():
+            ranked_list = sorted(
+                info_list, key=lambda info: get_expected_value(info, store, origin_priority), reverse=True
+            )
+            items.extend((rank, channel_index, info) for rank, info in enumerate(ranked_list))
+            channel_index += 1
+    items.sort(key=lambda item: (item[0], item[1]))
+    return [info for _, _, info in items]
+
+
+def get_sort_checkpoint() -> TestResultCacheData:
+    """
+    Get the test results of the sort checkpoint, the stale checkpoint is discarded
+    """
+    path = resource_path(constants.sort_checkpoint_path)
+    checkpoint: TestResultCacheData = {}
+    if not os.path.exists(path):
+        return checkpoint
+    if time() - os.path.getmtime(path) > constants.sort_checkpoint_ttl:
+        remove_sort_checkpoint()
+        return checkpoint
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    item = json.loads(line)
+                    checkpoint.setdefault(item["key"], []).append(item["result"])
+                except:
+                    continue
+    except Exception as e:
+        print(f"Read sort checkpoint failed: {e}")
+    return checkpoint
+
+
+def load_sort_checkpoint() -> int:
+    """
+    Load the test results of the sort checkpoint into the speed cache, return the number of the loaded keys
+    """
+    loaded_num = 0
+    for key, results in get_sort_checkpoint().items():
+        if key not in cache:
+            cache[key] = results
+            loaded_num += 1
+    return loaded_num
+
+
+def append_sort_checkpoint(file, key, result: TestResult):
+    """
+    Append the test result of the key to the sort checkpoint
+    """
+    try:
+        file.write(json.dumps({"key": key, "result": result}, ensure_ascii=False) + "\n")
+        file.flush()
+    except Exception as e:
+        print(f"Write sort checkpoint failed: {e}")
+
+
+def remove_sort_checkpoint():
+    """
+    Remove the sort checkpoint
+    """
+    try:
+        os.remove(resource_path(constants.sort_checkpoint_path))
+    except FileNotFoundError:
+        pass
 
 
 def sort_urls_key(item: ChannelTestResult) -> float:
@@ -346,6 +696,7 @@ def sort_urls(name, data, supply=config.open_supply, filter_speed=config.open_fi
             "ipv_type": ipv_type,
         }
         if origin == "whitelist":
+            sort_urls_total.inc(result="whitelist")
             filter_data.append(result)
             continue
         cache_key_match = re.search(r"cache:(.*)", url.partition("$")[2])
@@ -364,10 +715,16 @@ def sort_urls(name, data, supply=config.open_supply, filter_speed=config.open_fi
                         )
                 except Exception as e:
                     print(e)
-                if (not supply and filter_speed and avg_speed < min_speed) or (
-                        not supply and filter_resolution and get_resolution_value(resolution) < min_resolution) or (
-                        supply and avg_delay < 0):
+                if not supply and filter_speed and avg_speed < min_speed:
+                    sort_urls_total.inc(result="low_speed")
+                    continue
+                if not supply and filter_resolution and get_resolution_value(resolution) < min_resolution:
+                    sort_urls_total.inc(result="low_resolution")
+                    continue
+                if supply and avg_delay < 0:
+                    sort_urls_total.inc(result="no_response")
                     continue
+                sort_urls_total.inc(result="passed")
                 result["delay"] = avg_delay
                 result["speed"] = avg_speed
                 result["resolution"] = resolution
@@ -14,7 +14,6 @@ from time import time
 import pytz
 import requests
 from bs4 import BeautifulSoup
-from flask import send_file, make_response
 
 import utils.constants as constants
 from utils.config import config
@@ -374,36 +373,13 @@ def convert_to_m3u(first_channel_name=None):
                             m3u_output += f' group-title="{current_group}"'
                         m3u_output += f",{original_channel_name}\n{channel_link}\n"
             m3u_file_path = os.path.splitext(user_final_file)[0] + ".m3u"
-            with open(m3u_file_path, "w", encoding="utf-8") as m3u_file:
+            m3u_tmp_path = f"{m3u_file_path}.tmp"
+            with open(m3u_tmp_path, "w", encoding="utf-8") as m3u_file:
                 m3u_file.write(m3u_output)
+            os.replace(m3u_tmp_path, m3u_file_path)
             print(f"✅ M3U result file generated at: {m3u_file_path}")
 
 
-def get_result_file_content(show_content=False, file_type=None):
-    """
-    Get the content of the result file
-    """
-    user_final_file = resource_path(config.final_file)
-    result_file = (
-        os.path.splitext(user_final_file)[0] + f".{file_type}"
-        if file_type
-        else user_final_file
-    )
-    if os.path.exists(result_file):
-        if config.open_m3u_result:
-            if file_type == "m3u" or not file_type:
-                result_file = os.path.splitext(user_final_file)[0] + ".m3u"
-            if file_type != "txt" and show_content == False:
-                return send_file(result_file, as_attachment=True)
-        with open(result_file, "r", encoding="utf-8") as file:
-            content = file.read()
-    else:
-        content = constants.waiting_tip
-    response = make_response(content)
-    response.mimetype = 'text/plain'
-    return response
-
-
 def remove_duplicates_from_list(data_list, seen, flag=None, force_str=None):
     """
     Remove duplicates from data list
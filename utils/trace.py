@@ -0,0 +1,205 @@
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+from contextlib import contextmanager
+from time import time, process_time
+
+import utils.constants as constants
+from utils.tools import resource_path
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def get_peak_rss():
+    """
+    Get the peak resident set size of the process in MB, None if not supported by the platform
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class Span:
+    """
+    Timing span of the stage with the child spans, the cpu time and the peak rss are of the whole process,
+    the concurrent spans of other threads are included
+    """
+
+    def __init__(self, name, attrs=None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.children = []
+        self.start_time = time()
+        self.start_cpu = process_time()
+        self.start_peak_rss = get_peak_rss()
+        self.wall = None
+        self.cpu = None
+        self.peak_rss = None
+        self.lock = threading.Lock()
+
+    def add_child(self, span):
+        with self.lock:
+            self.children.append(span)
+
+    def finish(self):
+        self.wall = time() - self.start_time
+        self.cpu = process_time() - self.start_cpu
+        self.peak_rss = get_peak_rss()
+
+    def to_dict(self):
+        with self.lock:
+            children = list(self.children)
+        data = {
+            "name": self.name,
+            "start_time": round(self.start_time, 3),
+            "wall": round(self.wall, 3) if self.wall is not None else None,
+            "process_cpu": round(self.cpu, 3) if self.cpu is not None else None,
+            "process_peak_rss_mb": self.peak_rss,
+            "peak_rss_growth_mb": round(self.peak_rss - self.start_peak_rss, 1)
+            if self.peak_rss is not None and self.start_peak_rss is not None else None,
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if children:
+            data["children"] = [child.to_dict() for child in children]
+        return data
+
+
+class Tracer:
+    """
+    Tracer of the update run, the spans nest by the context of the current task or thread,
+    the chosen stage runs under cProfile
+    """
+
+    def __init__(self):
+        self.current = contextvars.ContextVar("trace_span", default=None)
+        self.root = None
+        self.profile_stage = None
+        self.profiler = None
+        self.worker_profilers = []
+        self.lock = threading.Lock()
+
+    def reset(self, name="update", profile_stage=None):
+        """
+        Start a new trace with the root span
+        """
+        self.root = Span(name)
+        self.current.set(self.root)
+        self.profile_stage = profile_stage
+
+    @contextmanager
+    def span(self, name, /, **attrs):
+        """
+        Time the block as a child span of the current span
+        """
+        parent = self.current.get()
+        if parent is None:
+            yield None
+            return
+        span = Span(name, attrs)
+        parent.add_child(span)
+        token = self.current.set(span)
+        profiler = self.start_profile(name)
+        try:
+            yield span
+        finally:
+            if profiler:
+                self.stop_profile(name)
+            span.finish()
+            self.current.reset(token)
+
+    def bind(self, func, name, /, **attrs):
+        """
+        Bind the function to a child span of the current span, used to trace the tasks of the thread pools,
+        the task is profiled with the stage if the stage is under cProfile
+        """
+        context = contextvars.copy_context()
+
+        def run(*args, **kwargs):
+            def call():
+                with self.span(name, **attrs):
+                    profiler = self.start_worker_profile()
+                    try:
+                        return func(*args, **kwargs)
+                    finally:
+                        if profiler:
+                            profiler.disable()
+
+            return context.copy().run(call)
+
+        return run
+
+    async def trace(self, coro, name, /, **attrs):
+        """
+        Await the coroutine in a child span of the current span
+        """
+        with self.span(name, **attrs):
+            return await coro
+
+    def start_profile(self, name):
+        if name != self.profile_stage or self.profiler is not None:
+            return None
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        return self.profiler
+
+    def start_worker_profile(self):
+        """
+        Profile the task of the worker thread during the profiled stage, before Python 3.12 cProfile only
+        instruments the thread enabling it, since 3.12 the profiler of the stage covers all the threads
+        """
+        if self.profiler is None or sys.version_info >= (3, 12):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        with self.lock:
+            self.worker_profilers.append(profiler)
+        return profiler
+
+    def stop_profile(self, name):
+        """
+        Stop the profiler and write the stats of the stage merged with the stats of the worker threads
+        """
+        profiler, self.profiler = self.profiler, None
+        profiler.disable()
+        with self.lock:
+            worker_profilers, self.worker_profilers = self.worker_profilers, []
+        try:
+            path = resource_path(constants.run_profile_stats_path.format(name=name), persistent=True)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            output = io.StringIO()
+            stats = pstats.Stats(profiler, *worker_profilers, stream=output)
+            stats.dump_stats(path)
+            stats.sort_stats("cumulative").print_stats(50)
+            with open(f"{os.path.splitext(path)[0]}.txt", "w", encoding="utf-8") as file:
+                file.write(output.getvalue())
+            print(f"Profile of {name} written to {path}")
+        except Exception as e:
+            print(f"Write profile of {name} failed: {e}")
+
+    def write(self, path=constants.run_profile_path):
+        """
+        Finish the root span and write the span tree to the file
+        """
+        if self.root is None:
+            return
+        self.root.finish()
+        try:
+            path = resource_path(path, persistent=True)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(self.root.to_dict(), file, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"Write run profile failed: {e}")
+
+
+tracer = Tracer()
@@ -30,3 +30,38 @@ class TestResult(TypedDict):
 TestResultCacheData = dict[str, list[TestResult]]
 
 ChannelTestResult = Union[ChannelData, TestResult]
+
+
+class HostState(TypedDict):
+    """
+    Host state types, including first_seen, last_seen, last_alive and fail_count
+    """
+    first_seen: float
+    last_seen: float
+    last_alive: float | None
+    fail_count: int
+
+
+HostStateData = dict[str, HostState]
+
+
+class SpeedResult(TypedDict):
+    """
+    Speed result types, including the test time and the test results of the cache key
+    """
+    time: float
+    results: list[TestResult]
+
+
+SpeedResultData = dict[str, SpeedResult]
+
+
+class HostLatency(TypedDict):
+    """
+    Host latency types, including the last record time and the latest latency samples (ms)
+    """
+    time: float
+    samples: list[int]
+
+
+HostLatencyData = dict[str, HostLatency]